@@ -0,0 +1,198 @@
+"""End-to-end probe benchmark against the local mock Power BI service.
+
+Starts benchmarks/mock_powerbi.py, writes synthetic area workbooks pointing at
+it and runs run_reports_in_parallel for each worker count in a fresh temporary
+directory, so no real tenant, credentials or network access are needed.
+Reports pages/min, p50/p99 page time and the peak memory of the browsers,
+per browser mode (headed Edge as the probe used to run it, or headless with
+extensions disabled and telemetry blocked). With --nodes the same run goes
+through a work queue to that many worker processes, each standing in for a
+worker host with one browser, to check that throughput scales with nodes.
+With --fixed-wait every page sleeps that long instead of waiting to settle,
+the way the probe used to, for a before/after comparison.
+
+run with: `python benchmarks/bench_probe.py --workers 1 2 4 --modes headed headless`
+      or: `python benchmarks/bench_probe.py --nodes 1 2 4`
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+import psutil
+from selenium import webdriver
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mock_powerbi import MockPowerBIService
+from run_report_check import (BrowserProfile, CountingEdge, PageReadiness, PowerBIRestClient, QueueScheduler,
+                              SessionCache, SQLiteWorkQueue, endpoint_token_fetcher, run_reports_in_parallel)
+
+AREAS = ["finance", "sales", "gscr"]
+MODES = {
+    "headed": BrowserProfile(),
+    "headless": BrowserProfile(headless=True, disable_extensions=True, block_telemetry=True),
+}
+
+def write_workbooks(service, directory):
+    rows = service.workbook_rows()
+    files = []
+    for i, area in enumerate(AREAS):
+        area_rows = rows[i::len(AREAS)]
+        if not area_rows:
+            continue
+        path = os.path.join(directory, f"{area}.xlsx")
+        pd.DataFrame(area_rows).to_excel(path, index=False)
+        files.append(os.path.basename(path))
+    return files
+
+def edge_factory(directory, browser):
+    def factory(slot):
+        options = webdriver.EdgeOptions()
+        options.add_argument(f"--user-data-dir={os.path.join(directory, f'profile_{slot}')}")
+        browser.apply(options)
+        driver = CountingEdge(options=options)
+        browser.prepare(driver)
+        return driver
+    return factory
+
+class MemorySampler:
+    """Samples the RSS of this process and all its children (drivers, browsers)."""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak_mb = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        me = psutil.Process()
+        while not self.stopped.is_set():
+            total = 0
+            for process in [me] + me.children(recursive=True):
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak_mb = max(self.peak_mb, total / 1024 / 1024)
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+def percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else 0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+def page_times(results):
+    # time_taken_seconds is logged as a "%.2f" string; only rendered pages count, not
+    # the header, pre-flight or short-circuited rows
+    times = []
+    for row in results:
+        if row[0] == "area" or str(row[6]).strip() not in ("error", "no error"):
+            continue
+        try:
+            times.append(float(row[8]))
+        except (TypeError, ValueError):
+            continue
+    return times
+
+def queue_worker(queue_path, directory, mode, node, readiness=None):
+    # A stand-in worker host with its own working directory and one browser
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    scheduler = QueueScheduler(SQLiteWorkQueue(queue_path), f"node{node}", poll_interval=0.5)
+    run_reports_in_parallel([], readiness=readiness, max_workers=1, driver_factory=edge_factory(directory, MODES[mode]),
+                            browser=MODES[mode], scheduler=scheduler)
+    scheduler.close()
+
+def run_once(service, workers, mode, preflight, nodes=False, readiness=None):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_probe_") as directory:
+        os.chdir(directory)
+        try:
+            files = write_workbooks(service, directory)
+            rest_client = None
+            if preflight:
+                session = SessionCache(endpoint_token_fetcher(service.token_url, "benchmark", "secret"),
+                                       path=os.path.join(directory, "token_cache.json"))
+                rest_client = PowerBIRestClient(session.token, base_url=service.api_url)
+            start = time.time()
+            with MemorySampler() as memory:
+                if nodes:
+                    queue_path = os.path.join(directory, "work_queue.db")
+                    processes = [multiprocessing.Process(target=queue_worker,
+                                                         args=(queue_path, os.path.join(directory, f"node{n}"), mode, n,
+                                                               readiness))
+                                 for n in range(workers)]
+                    work_queue = SQLiteWorkQueue(queue_path)
+                    for process in processes:
+                        process.start()
+                    results, _ = run_reports_in_parallel(files, rest_client=rest_client, browser=MODES[mode],
+                                                         work_queue=work_queue)
+                    for process in processes:
+                        process.join()
+                else:
+                    results, _ = run_reports_in_parallel(files, readiness=readiness, max_workers=workers,
+                                                         rest_client=rest_client,
+                                                         driver_factory=edge_factory(directory, MODES[mode]),
+                                                         browser=MODES[mode])
+            elapsed = time.time() - start
+        finally:
+            os.chdir(cwd)
+    times = page_times(results)
+    assert times, f"No rendered pages in the {mode} run with {workers} workers, check the mock service and driver"
+    return {
+        "mode": mode,
+        "workers": workers,
+        "pages": len(times),
+        "pages_per_min": len(times) / elapsed * 60 if elapsed else 0,
+        "p50": percentile(times, 50),
+        "p99": percentile(times, 99),
+        "peak_mb": memory.peak_mb,
+        "mb_per_instance": memory.peak_mb / workers,
+        "elapsed": elapsed,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["headless"])
+    parser.add_argument("--reports", type=int, default=12)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--visuals", type=int, default=6)
+    parser.add_argument("--render-delay", type=int, default=1500, help="mean visual render delay in ms")
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--preflight", action="store_true", help="list pages through the mock REST API")
+    parser.add_argument("--fixed-wait", type=float, default=None,
+                        help="sleep this many seconds per page instead of waiting for it to settle")
+    parser.add_argument("--nodes", type=int, nargs="+", default=None,
+                        help="run distributed through a work queue with this many worker processes instead of --workers")
+    args = parser.parse_args()
+
+    service = MockPowerBIService(args.reports, args.pages, args.visuals, args.render_delay,
+                                 error_rate=args.error_rate).start()
+    readiness = PageReadiness(fixed_wait=args.fixed_wait)
+    try:
+        print(f"Page waits: {f'fixed {args.fixed_wait:g}s' if args.fixed_wait else 'until settled'}")
+        print(f"{'mode':>9} {'nodes' if args.nodes else 'workers':>8} {'pages':>6} {'pages/min':>10} {'p50 s':>7} {'p99 s':>7} "
+              f"{'peak MB':>8} {'MB/inst':>8} {'total s':>8}")
+        for mode in args.modes:
+            for workers in args.nodes or args.workers:
+                stats = run_once(service, workers, mode, args.preflight, nodes=bool(args.nodes), readiness=readiness)
+                print(f"{stats['mode']:>9} {stats['workers']:>8} {stats['pages']:>6} {stats['pages_per_min']:>10.1f} "
+                      f"{stats['p50']:>7.2f} {stats['p99']:>7.2f} {stats['peak_mb']:>8.0f} "
+                      f"{stats['mb_per_instance']:>8.0f} {stats['elapsed']:>8.1f}")
+    finally:
+        service.stop()
@@ -0,0 +1,83 @@
+"""Scaling benchmark for ResultSet merging, per-area aggregation and result.html.
+
+Builds synthetic page results and times the merge, sort and one-pass summary
+used by run_reports_in_parallel and the email stage, next to the previous
+next()-per-key merge for the sizes where that is still bearable, plus the
+time and bytes per row of the grouped HTML report.
+
+run with: `python benchmarks/bench_results.py --sizes 1000 10000 100000`
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from run_report_check import ResultSet, ResultsReport
+
+AREAS = ["finance", "sales", "gscr", "services"]
+STATUSES = ["no error"] * 18 + ["error", "check_failed"]
+
+def synthetic_rows(count, pages_per_report=10, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        report = i // pages_per_report
+        area = AREAS[report % len(AREAS)]
+        url_report = f"https://app.powerbi.com/groups/g{report % 50}/reports/r{report}"
+        rows.append([
+            area,
+            f"Report {report}",
+            f"Dataset {report % 200}",
+            url_report,
+            f"{url_report}/ReportSection{i % pages_per_report}",
+            f"{i % pages_per_report + 1}/{pages_per_report}",
+            rng.choice(STATUSES),
+            "N/A",
+            f"{rng.uniform(2, 40):.2f}",
+            rng.randint(5, 40),
+        ])
+    rng.shuffle(rows)
+    return rows
+
+def legacy_merge(all_rows):
+    all_keys = {(r[2], r[3], r[4]) for r in all_rows}
+    return [next(r for r in all_rows if (r[2], r[3], r[4]) == key) for key in sorted(all_keys, key=str)]
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def report_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--legacy-max", type=int, default=10000,
+                        help="largest size to run the old quadratic merge on")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'merge s':>9} {'sort s':>9} {'summary s':>10} {'us/row':>8} {'legacy s':>9} "
+          f"{'html s':>8} {'html us/row':>12} {'bytes/row':>10}")
+    for size in args.sizes:
+        rows = synthetic_rows(size)
+        results, merge_time = timed(ResultSet, rows)
+        ordered, sort_time = timed(results.sorted)
+        summary, summary_time = timed(ordered.summarize)
+        assert len(ordered) == size
+        assert sum(s["total"] for a in summary.values() for s in a["datasets"].values()) == size
+        per_row = (merge_time + sort_time + summary_time) / size * 1e6
+        legacy = "-"
+        if size <= args.legacy_max:
+            _, legacy_time = timed(legacy_merge, rows)
+            legacy = f"{legacy_time:.3f}"
+        with tempfile.TemporaryDirectory() as directory:
+            _, html_time = timed(ResultsReport(os.path.join(directory, "result.html")).write, ordered)
+            html_bytes = report_size(directory)
+        print(f"{size:>8} {merge_time:>9.3f} {sort_time:>9.3f} {summary_time:>10.3f} {per_row:>8.2f} {legacy:>9} "
+              f"{html_time:>8.3f} {html_time / size * 1e6:>12.2f} {html_bytes / size:>10.0f}")
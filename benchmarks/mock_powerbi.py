@@ -0,0 +1,276 @@
+"""Local stand-in for the Power BI service used by the benchmarks.
+
+Serves synthetic reports whose DOM carries the elements the probe looks for
+(pbi-overlay-container, the pages-navigation-list, mid-viewport, visual
+containers with spinners, canvas-visual-error-overlay, span.textRun and close
+buttons) plus the REST endpoints used by the pre-flight, a client-credentials
+token endpoint for the session cache and a SendGrid mail/send stand-in for the
+notification dispatcher. Render delays, error rates and page counts are
+configurable and reproducible from a seed. Report pages poll a heartbeat
+endpoint in the background, as the real service does.
+
+run with: `python benchmarks/mock_powerbi.py --reports 20 --pages 8 --port 8765`
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<title>__TITLE__</title>
+<style>
+body { font-family: Arial, sans-serif; margin: 0; }
+.mid-viewport { display: flex; flex-wrap: wrap; }
+visual-container { display: block; width: 300px; height: 200px; margin: 8px; border: 1px solid #ccc; }
+.powerbi-spinner { position: fixed; top: 8px; right: 8px; }
+canvas-visual-error-overlay { display: block; background: #fcc; height: 100%; }
+</style>
+</head>
+<body>
+<div id="root"></div>
+<script>
+var CONFIG = __CONFIG__;
+var renderToken = 0;
+
+function currentSection() {
+    var last = location.pathname.split('/').pop();
+    return last.indexOf('ReportSection') === 0 ? last : CONFIG.pages[0].section;
+}
+
+function el(tag, className, text) {
+    var node = document.createElement(tag);
+    if (className) { node.className = className; }
+    if (text) { node.textContent = text; }
+    return node;
+}
+
+function render(section) {
+    var token = ++renderToken;
+    var page = CONFIG.pages.filter(function (p) { return p.section === section; })[0] || CONFIG.pages[0];
+    var root = document.getElementById('root');
+    root.innerHTML = '';
+    document.title = page.title;
+    root.appendChild(document.createElement('pbi-overlay-container'));
+
+    var nav = document.createElement('mat-action-list');
+    nav.setAttribute('data-testid', 'pages-navigation-list');
+    CONFIG.pages.forEach(function (p) {
+        var button = el('button', null, p.title);
+        button.onclick = function () {
+            history.pushState({}, '', CONFIG.base + '/' + p.section);
+            render(p.section);
+        };
+        nav.appendChild(button);
+    });
+    root.appendChild(nav);
+
+    var close = el('button', 'close-button', 'x');
+    close.onclick = function () { close.remove(); };
+    root.appendChild(close);
+
+    var spinner = el('div', 'powerbi-spinner', 'Loading...');
+    root.appendChild(spinner);
+    var viewport = el('div', 'mid-viewport');
+    root.appendChild(viewport);
+
+    var rendered = 0;
+    page.visual_delays.forEach(function (delay, i) {
+        var container = document.createElement('visual-container');
+        viewport.appendChild(container);
+        setTimeout(function () {
+            if (token !== renderToken) { return; }
+            var visual = el('div', 'visual');
+            if (page.error && i === 0) {
+                visual.appendChild(document.createElement('canvas-visual-error-overlay'));
+            } else {
+                visual.appendChild(el('span', 'textRun', i === 0 ? page.title : 'Value ' + (i * 37)));
+            }
+            container.appendChild(visual);
+            if (++rendered === page.visual_delays.length) { spinner.remove(); }
+        }, delay);
+    });
+    if (!page.visual_delays.length) { spinner.remove(); }
+}
+
+setTimeout(function () { render(currentSection()); }, CONFIG.boot_delay);
+// Background polling like the real service's, which never lets the network go quiet
+if (CONFIG.heartbeat_interval) {
+    setInterval(function () { fetch('/heartbeat').catch(function () {}); }, CONFIG.heartbeat_interval);
+}
+</script>
+</body>
+</html>
+"""
+
+
+class MockPowerBIService:
+    """Synthetic reports served over HTTP from a background thread.
+
+    Every report has ``pages`` pages; each page renders ``visuals`` visuals
+    that appear after ``render_delay`` ms on average (+/- ``jitter``). A share
+    of ``error_rate`` pages shows an error overlay and ``failed_dataset_rate``
+    of the datasets report a failed last refresh. With ``navigation_page`` the
+    first page of each report is a "Home Page" the probe should skip. Pages
+    fetch ``/heartbeat`` every ``heartbeat_interval`` ms (0 turns it off).
+    """
+
+    def __init__(self, reports=10, pages=5, visuals=6, render_delay=1500, jitter=0.5, boot_delay=300,
+                 error_rate=0.1, failed_dataset_rate=0.0, navigation_page=False, heartbeat_interval=500, seed=42,
+                 port=0):
+        rng = random.Random(seed)
+        self.reports = {}
+        for r in range(reports):
+            report_id = f"report{r}"
+            page_list = []
+            for p in range(pages):
+                section = "ReportSection" + hashlib.md5(f"{report_id}/{p}".encode()).hexdigest()[:20]
+                title = "Home Page" if navigation_page and p == 0 else f"Page {p + 1}"
+                page_list.append({
+                    "section": section,
+                    "title": title,
+                    "error": rng.random() < error_rate,
+                    "visual_delays": [round(render_delay * rng.uniform(1 - jitter, 1 + jitter)) for _ in range(visuals)],
+                })
+            self.reports[report_id] = {
+                "name": f"Benchmark Report {r}",
+                "dataset_id": f"dataset{r % max(1, reports // 3)}",
+                "pages": page_list,
+            }
+        datasets = sorted({report["dataset_id"] for report in self.reports.values()})
+        self.failed_datasets = {d for d in datasets if rng.random() < failed_dataset_rate}
+        self.boot_delay = boot_delay
+        self.heartbeat_interval = heartbeat_interval
+        self.token_lifetime = 3600
+        self.tokens_issued = 0
+        self.mail_failures = 0
+        self.mails = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return f"{self.url}/v1.0/myorg"
+
+    @property
+    def token_url(self):
+        return f"{self.url}/oauth2/v2.0/token"
+
+    def report_url(self, report_id):
+        return f"{self.url}/groups/benchmark/reports/{report_id}"
+
+    def workbook_rows(self):
+        return [{"PBI Report Name": report["name"], "PBI Link": self.report_url(report_id),
+                 "PBI Dataset Name": report["dataset_id"]}
+                for report_id, report in self.reports.items()]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-powerbi", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def render_page(self, report_id):
+        report = self.reports[report_id]
+        config = {"base": f"/groups/benchmark/reports/{report_id}", "boot_delay": self.boot_delay,
+                  "heartbeat_interval": self.heartbeat_interval, "pages": report["pages"]}
+        return PAGE_TEMPLATE.replace("__TITLE__", report["name"]).replace("__CONFIG__", json.dumps(config))
+
+    def api(self, path):
+        match = re.match(r"/v1\.0/myorg(?:/groups/[^/]+)?/reports/([^/]+)(/pages)?$", path)
+        if match and match.group(1) in self.reports:
+            report_id, report = match.group(1), self.reports[match.group(1)]
+            if match.group(2):
+                return {"value": [{"name": p["section"], "displayName": p["title"], "order": i}
+                                  for i, p in enumerate(report["pages"])]}
+            return {"id": report_id, "name": report["name"], "datasetId": report["dataset_id"]}
+        match = re.match(r"/v1\.0/myorg(?:/groups/[^/]+)?/datasets/([^/]+)/refreshes$", path)
+        if match:
+            ended = datetime.now(timezone.utc) - timedelta(hours=1)
+            status = "Failed" if match.group(1) in self.failed_datasets else "Completed"
+            return {"value": [{"status": status, "endTime": ended.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}]}
+        return None
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/heartbeat":
+                    return self.respond("{}", "application/json")
+                if path.startswith("/v1.0/"):
+                    body = service.api(path)
+                    if body is None:
+                        return self.send_error(404)
+                    return self.respond(json.dumps(body), "application/json")
+                match = re.match(r"/groups/[^/]+/reports/([^/]+)", path)
+                if not match or match.group(1) not in service.reports:
+                    return self.send_error(404)
+                self.respond(service.render_page(match.group(1)), "text/html; charset=utf-8")
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if path == "/v3/mail/send":
+                    # Fail the first mail_failures sends to exercise the dispatcher's retries
+                    if service.mail_failures > 0:
+                        service.mail_failures -= 1
+                        return self.send_error(503)
+                    service.mails.append(json.loads(body))
+                    self.send_response(202)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if path != "/oauth2/v2.0/token":
+                    return self.send_error(404)
+                service.tokens_issued += 1
+                body = {"token_type": "Bearer", "expires_in": service.token_lifetime,
+                        "access_token": f"mock-token-{service.tokens_issued}"}
+                self.respond(json.dumps(body), "application/json")
+
+            def respond(self, body, content_type):
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--visuals", type=int, default=6)
+    parser.add_argument("--render-delay", type=int, default=1500, help="mean visual render delay in ms")
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--failed-dataset-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    service = MockPowerBIService(args.reports, args.pages, args.visuals, args.render_delay,
+                                 error_rate=args.error_rate, failed_dataset_rate=args.failed_dataset_rate,
+                                 port=args.port)
+    print(f"Serving {len(service.reports)} mock reports on {service.url}, e.g. {service.report_url('report0')}")
+    service.server.serve_forever()
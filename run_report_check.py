@@ -1,4 +1,5 @@
 import argparse
+from abc import ABC, abstractmethod
 import yaml
 import os
 import pandas as pd
@@ -8,91 +9,663 @@ from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
 from concurrent.futures import ThreadPoolExecutor
-from collections import defaultdict
+from collections import defaultdict, deque
+import hashlib
+import html
+import functools
+import json
+import mimetypes
+import queue
+import random
+import re
+import socket
+import sqlite3
+import tempfile
+import uuid
+import threading
 import ssl
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import psutil
+import numpy as np
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
 from urllib.error import URLError
 import base64            
+import ctypes
 from collections import defaultdict
+from io import BytesIO
+from PIL import Image
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+from statistics import median, quantiles
 
 EDGE_BASE_PROFILE_PATH = r"C:\Users\TK7234\AppData\Local\Microsoft\Edge\User Data"
+REPORT_DURATIONS_FILE = "report_durations.json"
 
 def load_config(config_file):
     with open(config_file, 'r') as file:
         return yaml.safe_load(file)
 
-def send_email(to_email, subject, content, attachment_paths=None, max_retries=3, retry_delay=5):
-    print("inside email")
-    message = Mail(
-    from_email='zedl_operations_nonprod@zebra.com',
-    to_emails=to_email,
-    subject=subject,
-    html_content=content
-    )
-    if attachment_paths:
-        for path in attachment_paths:
+def get_tenant_settings(config, tenant):
+    # Tenants can be a plain Edge profile name or a mapping with extra settings
+    settings = config.get(tenant) or {}
+    if isinstance(settings, str):
+        settings = {"profile": settings}
+    return settings
+
+class Tracer:
+    """Collects timed spans from every thread of a run.
+
+    ``write`` exports them as a Chrome trace (open in chrome://tracing or
+    ui.perfetto.dev to see what each worker was doing) plus per-phase
+    histograms, and ``print_summary`` lists the slowest phases.
+    """
+    BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.thread_names = {}
+
+    @contextmanager
+    def span(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            thread = threading.current_thread()
+            with self.lock:
+                self.thread_names[thread.ident] = thread.name
+                self.spans.append((name, thread.ident, start - self.origin, end - start, args))
+
+    def durations(self):
+        by_phase = defaultdict(list)
+        with self.lock:
+            for name, _, _, duration, _ in self.spans:
+                by_phase[name].append(duration)
+        return by_phase
+
+    def histograms(self):
+        histograms = {}
+        for name, durations in self.durations().items():
+            durations.sort()
+            counts = [0] * (len(self.BUCKETS) + 1)
+            for duration in durations:
+                counts[next((i for i, b in enumerate(self.BUCKETS) if duration <= b), len(self.BUCKETS))] += 1
+            histograms[name] = {
+                "count": len(durations),
+                "total_seconds": sum(durations),
+                "p50": durations[len(durations) // 2],
+                "p95": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                "max": durations[-1],
+                "buckets": dict(zip([f"<={b}s" for b in self.BUCKETS] + [f">{self.BUCKETS[-1]}s"], counts)),
+            }
+        return histograms
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        with self.lock:
+            events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                      for tid, name in self.thread_names.items()]
+            events += [{"name": name, "cat": "probe", "ph": "X", "pid": pid, "tid": tid,
+                        "ts": round(start * 1e6), "dur": round(duration * 1e6),
+                        "args": {k: str(v) for k, v in args.items()}}
+                       for name, tid, start, duration, args in self.spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, directory="traces"):
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        trace_path = os.path.join(directory, f"trace_{stamp}.json")
+        with open(trace_path, "w", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file)
+        with open(os.path.join(directory, f"phases_{stamp}.json"), "w", encoding="utf-8") as file:
+            json.dump(self.histograms(), file, indent=2)
+        print(f"Trace written to {trace_path}")
+        return trace_path
+
+    def print_summary(self):
+        histograms = sorted(self.histograms().items(), key=lambda item: item[1]["total_seconds"], reverse=True)
+        print(f"{'phase':<20} {'count':>6} {'total s':>9} {'p50 s':>7} {'p95 s':>7} {'max s':>7}")
+        for name, h in histograms:
+            print(f"{name:<20} {h['count']:>6} {h['total_seconds']:>9.1f} {h['p50']:>7.2f} {h['p95']:>7.2f} {h['max']:>7.2f}")
+
+TRACER = Tracer()
+
+def traced(name, label_arg=None):
+    # Wrap a function in a span; label_arg names the positional argument to attach to it
+    def decorator(fn):
+        position = fn.__code__.co_varnames.index(label_arg) if label_arg else None
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            span_args = {}
+            if label_arg:
+                span_args[label_arg] = kwargs.get(label_arg, args[position] if position < len(args) else None)
+            with TRACER.span(name, **span_args):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+SENDER_EMAIL = 'zedl_operations_nonprod@zebra.com'
+
+def encode_attachment(path):
+    # SendGrid takes attachments inline in the JSON request body, so the whole encoded
+    # file is held in memory either way; the attachment budget is what bounds it
+    with open(path, 'rb') as f:
+        return base64.b64encode(f.read()).decode()
+
+class NotificationDispatcher:
+    """Sends the per-area emails concurrently through one SendGrid client.
+
+    The SSL context and client are created once and shared by all sends.
+    Failed sends are retried with exponential backoff (``backoff`` seconds,
+    doubling up to ``max_backoff``, with jitter). ``host`` points the client
+    at a local stand-in instead of api.sendgrid.com.
+    """
+
+    def __init__(self, api_key=None, host=None, from_email=SENDER_EMAIL, workers=4, max_retries=3,
+                 backoff=2, max_backoff=30):
+        self.from_email = from_email
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        context = ssl.create_default_context()
+        context.verify_flags &= ~ssl.VERIFY_X509_STRICT
+        ssl._create_default_https_context = lambda: context
+        api_key = api_key or os.environ.get('SENDGRID_API_KEY')
+        self.client = SendGridAPIClient(api_key, host=host) if host else SendGridAPIClient(api_key)
+
+    def build_message(self, to_email, subject, content, attachment_paths=None):
+        message = Mail(from_email=self.from_email, to_emails=to_email, subject=subject, html_content=content)
+        for path in attachment_paths or []:
             if not os.path.exists(path):
                 continue
-            with open(path, 'rb') as f:
-                data = f.read()
-                encoded = base64.b64encode(data).decode()
-                attachment = Attachment(
-                    FileContent(encoded),
-                    FileName(os.path.basename(path)),
-                    FileType('image/png'),
-                    Disposition('attachment')
-                )
-                message.attachment = attachment
-    attempt = 0
-    while attempt < max_retries:
+            message.add_attachment(Attachment(
+                FileContent(encode_attachment(path)),
+                FileName(os.path.basename(path)),
+                FileType(mimetypes.guess_type(path)[0] or 'image/png'),
+                Disposition('attachment')
+            ))
+        return message
+
+    @traced("send_email", label_arg="subject")
+    def send(self, to_email, subject, content, attachment_paths=None):
+        message = self.build_message(to_email, subject, content, attachment_paths)
+        for attempt in range(self.max_retries):
+            try:
+                response = self.client.send(message)
+                if response.status_code in (200, 202):
+                    print(f"Email '{subject}' sent on attempt {attempt + 1}")
+                    return True
+                print(f"Unexpected status code {response.status_code} for '{subject}'")
+            except URLError as e:
+                print(f"URLError on attempt {attempt + 1} for '{subject}': {e.reason}")
+            except Exception as e:
+                print(f"Exception on attempt {attempt + 1} for '{subject}': {str(e)}")
+            if attempt + 1 < self.max_retries:
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1))
+        print(f"Failed to send '{subject}' after {self.max_retries} attempts.")
+        return False
+
+    def dispatch(self, notifications):
+        """Send every notification (dicts of ``send`` arguments) at once; returns how many went out."""
+        if not notifications:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(notifications)), thread_name_prefix="email") as executor:
+            sent = list(executor.map(lambda n: self.send(**n), notifications))
+        print(f"Sent {sum(sent)} of {len(notifications)} emails")
+        return sum(sent)
+
+def render_area_email(area, area_summary, recipients, attachment_budget):
+    """Subject, HTML body and attachments of one area's result email, as ``NotificationDispatcher.send`` arguments."""
+    file_errors = area_summary["errors"]
+    summary_stats = area_summary["datasets"]
+    print(f"Area:{area}: {len(file_errors)} errors across {len(summary_stats)} semantic models")
+
+    # Start email content with summary table
+    email_content = f"""
+    <h2>Summary of report check results for area: {area.upper()}</h2>
+    <table border='1' style='border-collapse: collapse;'>
+        <tr>
+            <th style='padding: 8px;'>Semantic Model</th>
+            <th style='padding: 8px;'>Total Reports</th>
+            <th style='padding: 8px;'>Errors</th>
+            <th style='padding: 8px;'>Successful</th>
+            <th style='padding: 8px;'>Short-circuited</th>
+        </tr>
+    """
+
+    for dataset, stats in summary_stats.items():
+        successful = stats["total"] - stats["errors"]
+        email_content += f"""
+        <tr>
+            <td style='padding: 8px;'>{dataset}</td>
+            <td style='padding: 8px;'>{stats['total']}</td>
+            <td style='padding: 8px;'>{stats['errors']}</td>
+            <td style='padding: 8px;'>{successful}</td>
+            <td style='padding: 8px;'>{stats['short_circuited']}</td>
+        </tr>
+        """
+
+    email_content += "</table>"
+
+    attachment_paths = []
+    if file_errors:
+        email_content += "<h3>Errored Reports below:</h3>"
+        for row in file_errors:
+            report_name = row[1]
+            dataset = row[2]
+            screenshot_path = row[7]
+            email_content += f"<p>Report: {report_name} <br>Dataset: {dataset}</p>"
+            if screenshot_path != "N/A" and os.path.exists(screenshot_path):
+                attachment_paths.append(screenshot_path)
+            else:
+                print("No screenshot for:", report_name)
+
+    if isinstance(recipients, list):
+        recipients = ",".join(recipients)
+    return {
+        "to_email": recipients,
+        "subject": f"Power BI Errors Detected - {area.capitalize()}",
+        "content": email_content,
+        "attachment_paths": screenshot_attachments(attachment_paths, attachment_budget),
+    }
+
+READINESS_SCRIPT = """
+var spinnerSelector = arguments[0], visualSelector = arguments[1], renderedSelector = arguments[2];
+var ignorePattern = arguments[3], restart = arguments[4];
+var now = Date.now();
+var s = window.__pbiReadiness;
+if (!s) {
+    s = window.__pbiReadiness = {lastMutation: now, lastResource: now, since: now, seen: 0, inflight: {}, nextId: 0};
+    if (performance.setResourceTimingBufferSize) { performance.setResourceTimingBufferSize(100000); }
+    new MutationObserver(function () { s.lastMutation = Date.now(); })
+        .observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+    var track = function (url) {
+        if (s.ignore && s.ignore.test(String(url))) { return null; }
+        var id = s.nextId++;
+        s.inflight[id] = Date.now();
+        return function () { delete s.inflight[id]; s.lastResource = Date.now(); };
+    };
+    var open = XMLHttpRequest.prototype.open, send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.open = function (method, url) {
+        this.__pbiUrl = url;
+        return open.apply(this, arguments);
+    };
+    XMLHttpRequest.prototype.send = function () {
+        var done = track(this.__pbiUrl);
+        if (done) { this.addEventListener('loadend', done); }
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function (input) {
+            var done = track(input && input.url ? input.url : input);
+            var result = fetch.apply(this, arguments);
+            return done ? result.finally(done) : result;
+        };
+    }
+}
+s.ignore = ignorePattern ? new RegExp(ignorePattern) : null;
+if (restart) { s.since = now; s.lastResource = now; }
+// Only requests started since we began waiting count, and never background polling
+// matching the ignore pattern, which would otherwise keep the network busy forever
+var entries = performance.getEntriesByType('resource');
+for (; s.seen < entries.length; s.seen++) {
+    var entry = entries[s.seen];
+    if (performance.timeOrigin + entry.startTime >= s.since && !(s.ignore && s.ignore.test(entry.name))) {
+        s.lastResource = now;
+    }
+}
+var pendingRequests = 0;
+for (var id in s.inflight) { if (s.inflight[id] >= s.since) { pendingRequests++; } }
+var spinners = 0;
+document.querySelectorAll(spinnerSelector).forEach(function (el) {
+    if (el.offsetParent !== null) { spinners++; }
+});
+var visuals = document.querySelectorAll(visualSelector);
+var pending = 0;
+visuals.forEach(function (v) { if (!v.querySelector(renderedSelector)) { pending++; } });
+return {
+    document_ready: document.readyState === 'complete',
+    spinners: spinners,
+    visuals: visuals.length,
+    pending_visuals: pending,
+    pending_requests: pendingRequests,
+    dom_quiet_ms: now - s.lastMutation,
+    network_quiet_ms: now - s.lastResource
+};
+"""
+
+PAGE_SNAPSHOT_SCRIPT = """
+var textRuns = [];
+document.querySelectorAll('span.textRun').forEach(function (span) {
+    // Visible text only, as WebElement.text would give; hidden pages and tooltips keep their text in the DOM
+    if (!span.getClientRects().length) { return; }
+    var text = (span.innerText || '').trim().toLowerCase();
+    if (text) { textRuns.push(text); }
+});
+var closeButtons = [];
+document.querySelectorAll("button[class*='close-button']").forEach(function (button) {
+    var rect = button.getBoundingClientRect();
+    closeButtons.push({x: rect.left + rect.width / 2, y: rect.top + rect.height / 2});
+});
+return {
+    url: location.href,
+    title: document.title,
+    text_runs: textRuns,
+    error_overlays: document.querySelectorAll('canvas-visual-error-overlay').length,
+    visuals: document.querySelectorAll('visual-container').length,
+    close_buttons: closeButtons
+};
+"""
+
+CLOSE_REPORTS_SCRIPT = """
+var closed = 0;
+document.querySelectorAll("button[class*='close-button']").forEach(function (button) {
+    try { button.click(); closed++; } catch (e) {}
+});
+return closed;
+"""
+
+class CountingEdge(webdriver.Edge):
+    """Edge driver that counts WebDriver commands, i.e. HTTP round trips to the browser."""
+    round_trips = 0
+
+    def execute(self, driver_command, params=None):
+        self.round_trips += 1
+        return super().execute(driver_command, params)
+
+class PageReadiness:
+    """Decides when a report page has settled instead of sleeping a fixed time.
+
+    A page is ready once the document has loaded, no spinner is visible, every
+    visual container has rendered content, no XHR/fetch call is in flight and
+    neither the DOM nor the network has changed for ``quiet_seconds``. Only
+    requests started since the wait began count, and URLs matching the
+    ``ignore_requests`` regex (telemetry, heartbeats, other background
+    polling) never do. ``fixed_wait`` replaces all this with the old fixed
+    sleep, to compare the two on a real tenant. Per-report overrides come
+    from the ``readiness.reports`` section of tenants.yaml, keyed by PBI
+    Report Name.
+    """
+    DEFAULTS = {
+        "timeout": 30,
+        "quiet_seconds": 1.5,
+        "poll_interval": 0.25,
+        "error_wait": 2,
+        "spinner_selector": ".powerbi-spinner, .spinner, .circle-spinner, [role='progressbar']",
+        "visual_selector": "visual-container",
+        "rendered_selector": ".visual, .visualContent, canvas-visual-error-overlay",
+        "ignore_requests": r"heartbeat|/ping\b|telemetry|/signalr/|dc\.services\.visualstudio\.com"
+                           r"|events\.data\.microsoft\.com|clarity\.ms",
+        "fixed_wait": None,
+    }
+
+    def __init__(self, reports=None, **settings):
+        self.settings = dict(self.DEFAULTS)
+        self.settings.update({k: v for k, v in settings.items() if k in self.DEFAULTS})
+        self.reports = reports or {}
+        for name, value in self.settings.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_config(cls, tenant_settings):
+        return cls(**(tenant_settings.get("readiness") or {}))
+
+    def for_report(self, report_name):
+        overrides = self.reports.get(report_name)
+        if not overrides:
+            return self
+        return PageReadiness(reports=self.reports, **{**self.settings, **overrides})
+
+    def snapshot(self, driver, restart=False):
+        return driver.execute_script(
+            READINESS_SCRIPT,
+            self.spinner_selector,
+            self.visual_selector,
+            self.rendered_selector,
+            self.ignore_requests,
+            restart,
+        )
+
+    def is_settled(self, state, elapsed=None):
+        # Quiet time only counts from when we started waiting, otherwise a page
+        # that was idle before a click would look settled before it re-renders
+        if self.fixed_wait:
+            return elapsed is not None and elapsed >= self.fixed_wait
+        quiet_ms = self.quiet_seconds * 1000
+        if not state or (elapsed is not None and elapsed * 1000 < quiet_ms):
+            return False
+        return bool(
+            state["document_ready"]
+            and state["spinners"] == 0
+            and state["pending_visuals"] == 0
+            and state["pending_requests"] == 0
+            and state["dom_quiet_ms"] >= quiet_ms
+            and state["network_quiet_ms"] >= quiet_ms
+        )
+
+    def wait(self, driver, label="", timeout=None):
+        """Poll until the page settles; returns the seconds it took, or None on timeout."""
+        if self.fixed_wait:
+            time.sleep(self.fixed_wait)
+            print(f"Waited a fixed {self.fixed_wait}s {label}".rstrip())
+            return self.fixed_wait
+        timeout = timeout or self.timeout
+        start_time = time.time()
+        state = None
+        restart = True
+        while True:
+            try:
+                # The first snapshot marks where this wait starts; after a click the document stays the same
+                state = self.snapshot(driver, restart)
+                restart = False
+            except Exception:
+                # Navigation in progress or script blocked; try again next poll
+                state = None
+            elapsed = time.time() - start_time
+            if self.is_settled(state, elapsed):
+                print(f"Page ready in {elapsed:.2f}s {label}".rstrip())
+                return elapsed
+            if elapsed >= timeout:
+                print(f"Page not settled after {elapsed:.2f}s {label}, continuing. Last state: {state}")
+                return None
+            time.sleep(self.poll_interval)
+
+TELEMETRY_URL_PATTERNS = [
+    "*dc.services.visualstudio.com*",
+    "*.events.data.microsoft.com*",
+    "*browser.pipe.aria.microsoft.com*",
+    "*.clarity.ms*",
+]
+
+class BrowserProfile:
+    """How the probe's Edge instances are launched, from the ``browser`` section of tenants.yaml.
+
+    The default is the headed, maximized Edge the probe always used. Headless
+    mode renders into a fixed ``window_size`` viewport (so screenshots have
+    the same size on every machine), opens no windows and skips GPU
+    compositing. ``block_urls`` are wildcard patterns blocked in every tab
+    through CDP; ``block_telemetry`` adds the usual Power BI telemetry hosts.
+    """
+    DEFAULTS = {
+        "headless": False,
+        "window_size": None,
+        "disable_extensions": False,
+        "block_telemetry": False,
+        "block_urls": [],
+    }
+    HEADLESS_WINDOW_SIZE = "1920,1080"
+
+    def __init__(self, **settings):
+        self.settings = dict(self.DEFAULTS)
+        self.settings.update({k: v for k, v in settings.items() if k in self.DEFAULTS})
+        for name, value in self.settings.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_config(cls, tenant_settings):
+        return cls(**(tenant_settings.get("browser") or {}))
+
+    @property
+    def blocked_urls(self):
+        return list(self.block_urls or []) + (TELEMETRY_URL_PATTERNS if self.block_telemetry else [])
+
+    def apply(self, options):
+        window_size = self.window_size or (self.HEADLESS_WINDOW_SIZE if self.headless else None)
+        if self.headless:
+            options.add_argument("--headless=new")
+            options.add_argument("--disable-gpu")
+            options.add_argument("--hide-scrollbars")
+            options.add_argument("--mute-audio")
+        if window_size:
+            options.add_argument(f"--window-size={window_size}")
+        else:
+            options.add_argument("--start-maximized")
+        if self.disable_extensions:
+            options.add_argument("--disable-extensions")
+            options.add_argument("--disable-component-extensions-with-background-pages")
+        return options
+
+    def prepare(self, driver):
+        """Block the configured URLs in the driver's current tab; call again for every new tab."""
+        patterns = self.blocked_urls
+        if not patterns:
+            return
         try:
-            context = ssl.create_default_context()
-            context.verify_flags &= ~ssl.VERIFY_X509_STRICT
-            ssl._create_default_https_context = lambda: context
-            sg = SendGridAPIClient(os.environ.get('SENDGRID_API_KEY'))
-            response = sg.send(message)
-            if response.status_code in (200, 202):
-                print(f"Email sent successfully on attempt {attempt + 1}")
-                return 
-            print(f"Unexpected status code {response.status_code}, retrying...")
-        except URLError as e:
-            print(f"URLError on attempt {attempt + 1}: {e.reason}")
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
         except Exception as e:
-            print(f"Exception on attempt {attempt + 1}: {str(e)}")
-        attempt += 1
-        if attempt < max_retries:
-            time.sleep(retry_delay)
-    print("Failed to send email after multiple attempts.")
+            print(f"Could not block URLs in this tab: {e}")
+
+CIRCUIT_OPEN_STATUS = "dataset_circuit_open"
+VISUAL_DRIFT_STATUS = "visual_drift"
+
+class DatasetCircuitBreaker:
+    """Stops rendering pages of a semantic model that keeps failing.
+
+    Circuits are keyed by dataset name, optionally together with the workspace
+    of the report. After ``threshold`` consecutive failed pages the circuit
+    opens and pages are logged as ``dataset_circuit_open`` without being
+    rendered. Once ``cooldown`` seconds have passed one worker is let through
+    (half-open) until it checks a page: a pass closes the circuit, a failure
+    opens it again. The grant belongs to that worker (``holder``), so its
+    report-level check, skipped pages and the page it checks all get through.
+    """
+
+    def __init__(self, threshold=3, cooldown=300, per_workspace=False):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.per_workspace = per_workspace
+        self.lock = threading.Lock()
+        self.circuits = {}
+
+    def key(self, dataset_name, report_url):
+        if self.per_workspace:
+            return (parse_report_url(report_url)[1], dataset_name)
+        return (None, dataset_name)
+
+    def allow(self, key, holder=None):
+        with self.lock:
+            circuit = self.circuits.get(key)
+            if not circuit or circuit["opened_at"] is None:
+                return True
+            now = time.time()
+            probe_due = now - circuit["opened_at"] >= self.cooldown
+            probe_running = circuit["probe_at"] and now - circuit["probe_at"] < self.cooldown
+            if probe_running:
+                return holder is not None and circuit["probe_holder"] is holder
+            if probe_due:
+                circuit.update(probe_at=now, probe_holder=holder)
+                print(f"Circuit for dataset '{key[1]}' half-open, letting one page through")
+                return True
+            return False
+
+    def record(self, key, failed):
+        with self.lock:
+            circuit = self.circuits.setdefault(key, {"failures": 0, "opened_at": None, "probe_at": None,
+                                                     "probe_holder": None})
+            if not failed:
+                if circuit["opened_at"] is not None:
+                    print(f"Circuit for dataset '{key[1]}' closed again")
+                circuit.update(failures=0, opened_at=None, probe_at=None, probe_holder=None)
+                return
+            circuit["failures"] += 1
+            if circuit["probe_at"] or (circuit["opened_at"] is None and circuit["failures"] >= self.threshold):
+                print(f"Circuit for dataset '{key[1]}' opened after {circuit['failures']} consecutive failures")
+                circuit.update(opened_at=time.time(), probe_at=None, probe_holder=None)
 
 class PowerBIReportProbe:
-    def __init__(self, profile_suffix):
+    SKIP_KEYWORDS = ["home page", "navigation"]  # Add more keywords if needed
+    RESULT_COLUMNS = ["area", "report_name", "dataset_name", "url_report", "url_page", "page_num",
+                      "has_report_page_errors", "screenshot_path", "time_taken_seconds", "round_trips"]
+
+    def __init__(self, profile_suffix, readiness=None, max_tabs=1, browser=None):
         self.profile_suffix = profile_suffix
-        self.results = [["area", "report_name", "dataset_name", "url_report", "url_page", "page_nr", "has_error"]]
+        self.results = [list(self.RESULT_COLUMNS)]
         self.has_found_any_errors = "no error"
         self.screenshots_dir = "Default"
         self.driver = None
         self.token = None
         self.powerBIBaseUrl = "https://api.powerbi.com/v1.0/myorg"
-        self.api = "https://analysis.windows.net/powerbi/api/.default"
-    
+        self.api = POWERBI_SCOPE
+        self.readiness = readiness or PageReadiness()
+        self.page_readiness = self.readiness
+        self.max_tabs = max_tabs
+        self.browser = browser or BrowserProfile()
+        self.session = None
+        self.round_trip_mark = 0
+        self.page_snapshot = None
+        self.screenshots = None
+        self.breaker = None
+        self.circuit_key = None
+        self.timeouts = None
+        self.current_report = None
+        self.journal = None
+        self.journal_attempt = None
+        self.completed_pages = set()
+
     def _authenticate(self):
         auth = InteractiveBrowserCredential()
         self.token = auth.get_token(self.api).token
         if self.token:
             print("Authenticated")
 
+    @traced("driver_startup")
     def init_selenium_driver_edge(self):
         options = webdriver.EdgeOptions()
-        profile_dir = os.path.join(EDGE_BASE_PROFILE_PATH, f"AutoProfile_{self.profile_suffix}")
+        if self.session:
+            # Signed in through the shared session cache, so a throwaway profile will do
+            profile_dir = os.path.join(tempfile.gettempdir(), "pbi_probe_profiles", f"slot_{self.profile_suffix}")
+        else:
+            profile_dir = os.path.join(EDGE_BASE_PROFILE_PATH, f"AutoProfile_{self.profile_suffix}")
         options.add_argument(f"--user-data-dir={profile_dir}")
-        options.add_argument("--start-maximized")
-        self.driver = webdriver.Edge(options=options)
-        time.sleep(2)
+        self.browser.apply(options)
+        if self.max_tabs > 1:
+            # Keep background tabs rendering at full speed while we poll other tabs
+            options.add_argument("--disable-background-timer-throttling")
+            options.add_argument("--disable-backgrounding-occluded-windows")
+            options.add_argument("--disable-renderer-backgrounding")
+        self.driver = CountingEdge(options=options)
+        self.browser.prepare(self.driver)
+        if self.session:
+            self.session.inject(self.driver)
+        return self.driver
 
-    def get_report_page_url(self, report_base_url, page_number=None):
-        if not page_number or page_number == 1 or page_number == 0:
+    def get_report_page_url(self, report_base_url, page_number=None, section_id=None):
+        if section_id is not None:
+            url = report_base_url + f"/ReportSection{section_id}"
+        elif not page_number or page_number == 1 or page_number == 0:
             url = report_base_url + "/ReportSection"
         else:
             url = report_base_url + f"/ReportSection{page_number}"
@@ -104,19 +677,29 @@ class PowerBIReportProbe:
             sectionId = url.split("ReportSection")[1].split("?")[0]
         return sectionId
 
-    def load_report_page_by_url(self, url, screenshot_name=None):
+    @traced("load_page")
+    def load_report_page_by_url(self, url, screenshot_name=None, page=""):
         print(f"loading url: {url}")
         try:
-            self.driver.get(url)
+            with TRACER.span("navigate", url=url):
+                self.driver.get(url)
         except Exception as e:
             print(f"Failed to load URL: {url}")
             print(f"Current URL: {self.driver.current_url}")
             print(f"Driver state: {self.driver.session_id}")
             raise e
 
-        WebDriverWait(self.driver, 20).until(
-            EC.presence_of_element_located((By.TAG_NAME, "pbi-overlay-container"))
-        )
+        wait_start = time.time()
+        limit = self.wait_timeout("overlay", 20, page)
+        try:
+            with TRACER.span("overlay_wait"):
+                WebDriverWait(self.driver, limit).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "pbi-overlay-container"))
+                )
+        except TimeoutException:
+            self.record_timeout("overlay", limit, page)
+            raise
+        self.record_timing("overlay", time.time() - wait_start, page)
 
         try:
             pageNavBtn = WebDriverWait(self.driver, 1).until(
@@ -129,79 +712,345 @@ class PowerBIReportProbe:
             print("Page Expand Button not present.")
         
         print("Loaded Page")
-        time.sleep(15)
+        self.wait_until_ready(url, page)
 
         screenshot_path = None
         if screenshot_name:
             screenshots_dir = self.screenshots_dir
             os.makedirs(screenshots_dir, exist_ok=True)
             screenshot_path = os.path.join(screenshots_dir, screenshot_name)
-            self.driver.save_screenshot(screenshot_path)
+            screenshot_path = self.save_screenshot(screenshot_path)
+        return screenshot_path
+
+    def round_trips(self):
+        return getattr(self.driver, "round_trips", 0)
+
+    @traced("screenshot")
+    def save_screenshot(self, screenshot_path):
+        # With a ScreenshotStore the PNG bytes are handed off and written in the background
+        if self.screenshots:
+            return self.screenshots.capture(self.driver, os.path.basename(screenshot_path))
+        self.driver.save_screenshot(screenshot_path)
         return screenshot_path
 
-    def has_report_page_error_visuals(self, seconds=10) -> bool:
-        print(f"Checking for visuals with errors in {self.driver.current_url}")
+    def wait_timeout(self, phase, default, page=""):
+        if not self.timeouts:
+            return default
+        return self.timeouts.timeout(phase, self.current_report, page, default)
+
+    def record_timing(self, phase, seconds, page=""):
+        if self.timeouts and seconds is not None:
+            self.timeouts.history.record(phase, self.current_report, page, seconds)
+
+    def record_timeout(self, phase, limit, page=""):
+        # A wait that timed out took at least its limit. Keeping it as a sample at the
+        # limit lets the p95 climb, so a page that got slower is not cut off every run
+        self.record_timing(phase, limit, page)
+
+    def timing_page(self, url):
+        # Timings are kept per section id, which is the same whether the page was reached
+        # by clicking through the nav list or by URL, however hidden pages were numbered
+        return self.get_report_page_id(page_key(url)) or page_key(url)
+
+    @traced("readiness")
+    def wait_until_ready(self, label, page=""):
+        timeout = self.wait_timeout("readiness", self.page_readiness.timeout, page)
+        elapsed = self.page_readiness.wait(self.driver, label, timeout)
+        if self.page_readiness.fixed_wait:
+            return  # A fixed sleep says nothing about how long the page needs
+        if elapsed is None:
+            self.record_timeout("readiness", timeout, page)
+        else:
+            self.record_timing("readiness", elapsed, page)
+
+    def circuit_allows(self, area, report_name, report_base_url, dataset_name, url, report_page_number):
+        if not self.breaker or self.breaker.allow(self.circuit_key, holder=self):
+            return True
+        print(f"Circuit open for dataset '{dataset_name}', not checking {url}")
+        self.log_results(area, report_name, dataset_name, report_base_url, url, report_page_number, CIRCUIT_OPEN_STATUS)
+        return False
+
+    def inspect_page(self):
+        """Collect everything the checks need from the page in a single script call."""
+        self.page_snapshot = self.driver.execute_script(PAGE_SNAPSHOT_SCRIPT)
+        return self.page_snapshot
+
+    @traced("error_detection")
+    def has_report_page_error_visuals(self, seconds=10, poll_interval=0.5, page="") -> bool:
+        wait_start = time.time()
+        deadline = wait_start + self.wait_timeout("error_overlay", seconds, page)
+        while True:
+            snapshot = self.inspect_page()
+            if snapshot["error_overlays"]:
+                self.record_timing("error_overlay", time.time() - wait_start, page)
+                print(f"Found {snapshot['error_overlays']} visuals with errors in {snapshot['url']}")
+                self.has_found_any_errors = "error"
+                return "error"
+            if time.time() >= deadline:
+                print(f"no errors in visuals found in {snapshot['url']}")
+                return "no error"
+            time.sleep(poll_interval)
+
+    @traced("close_reports")
+    def close_open_reports(self, snapshot=None):
+        if snapshot is not None and not snapshot["close_buttons"]:
+            return
         try:
-            WebDriverWait(self.driver, seconds).until(
-                EC.presence_of_element_located((By.TAG_NAME, "canvas-visual-error-overlay"))
-            )
-            self.has_found_any_errors = "error"
-            return "error"
-        except:
-            print("no errors in visuals found")
-            return "no error"
+            closed = self.driver.execute_script(CLOSE_REPORTS_SCRIPT)
+            if closed:
+                print(f"Closed {closed} open reports")
+        except Exception as e:
+            print(f"An error occurred while trying to close open reports: {e}")
 
-    def close_open_reports(self):
+    def should_skip_page(self, page_number, snapshot=None):
         try:
-            close_buttons = self.driver.find_elements(By.XPATH, "//button[contains(@class, 'close-button')]")
-            for button in close_buttons:
+            span_texts = (snapshot or self.inspect_page())["text_runs"]
+            if any(skip_word in text for skip_word in self.SKIP_KEYWORDS for text in span_texts):
+                print(f"Skipping page {page_number} due to skip keyword match.")
+                return True
+        except Exception as e:
+            print(f"Error checking for skip keywords on page {page_number}: {e}")
+        return False
+
+    def discover_page_urls(self, report_base_url, buttons):
+        # Clicking a nav button switches the route straight away; we only need the
+        # section id from the URL, not a rendered page
+        page_urls = []
+        for page_number, button in enumerate(buttons, start=1):
+            previous_url = self.driver.current_url
+            try:
+                button.click()
+                WebDriverWait(self.driver, 5).until(lambda d: d.current_url != previous_url)
+            except Exception:
+                pass
+            current_url = self.driver.current_url
+            section_id = self.get_report_page_id(current_url)
+            if page_number > 1 and current_url == previous_url:
+                page_urls.append(self.get_report_page_url(report_base_url, page_number))
+            elif section_id:
+                page_urls.append(self.get_report_page_url(report_base_url, section_id=section_id))
+            else:
+                page_urls.append(current_url.split("?")[0])
+        return page_urls
+
+    def check_pages_in_tabs(self, area, report_name, report_base_url, dataset_name, page_urls, check_skip=True,
+                            page_numbers=None, report_pages_count=None):
+        """Render up to ``max_tabs`` pages of a report at once, one tab per page.
+
+        Pages load in parallel inside the browser while this thread polls each
+        tab's readiness; a tab is reused for the next page once recorded.
+        """
+        readiness = self.page_readiness
+        report_pages_count = report_pages_count or len(page_urls)
+        main_handle = self.driver.current_window_handle
+        pending = deque(zip(page_numbers or range(1, len(page_urls) + 1), page_urls))
+        open_tabs = {}
+        tab_round_trips = {}
+
+        def load_next(handle=None):
+            while pending:
+                page_number, url = pending.popleft()
+                if self.circuit_allows(area, report_name, report_base_url, dataset_name, url,
+                                       f"{page_number}/{report_pages_count}"):
+                    break
+            else:
+                return False
+            round_trips_before = self.round_trips()
+            if handle is None:
+                self.driver.switch_to.new_window("tab")
+                handle = self.driver.current_window_handle
+                self.browser.prepare(self.driver)
+            else:
+                self.driver.switch_to.window(handle)
+            print(f"loading url in tab: {url}")
+            try:
+                self.driver.get(url)
+            except Exception as e:
+                print(f"Failed to load URL {url}: {e}")
+            open_tabs[handle] = (page_number, url, time.time())
+            # Opening or switching the tab and loading the page belong to this page
+            tab_round_trips[handle] = self.round_trips() - round_trips_before
+            return True
+
+        while pending and len(open_tabs) < self.max_tabs:
+            if not load_next():
+                break
+
+        while open_tabs:
+            for handle, (page_number, url, page_start) in list(open_tabs.items()):
+                round_trips_before = self.round_trips()
+                self.driver.switch_to.window(handle)
+                try:
+                    state = readiness.snapshot(self.driver)
+                except Exception:
+                    state = None
+                elapsed = time.time() - page_start
+                settled = readiness.is_settled(state, elapsed)
+                polled_at = self.round_trips()
+                tab_round_trips[handle] += polled_at - round_trips_before
+                limit = self.wait_timeout("readiness", readiness.timeout, self.timing_page(url))
+                if not settled and elapsed < limit:
+                    continue
+                if readiness.fixed_wait:
+                    pass
+                elif settled:
+                    self.record_timing("readiness", elapsed, self.timing_page(url))
+                else:
+                    self.record_timeout("readiness", limit, self.timing_page(url))
+                print(f"Page {page_number} {'ready' if settled else 'not settled'} after {elapsed:.2f}s in tab")
+                del open_tabs[handle]
                 try:
-                    button.click()
-                    print("Closed an open report")
+                    snapshot = self.inspect_page()
                 except Exception as e:
-                    print(f"Failed to click close button: {e}")
+                    print(f"Failed to inspect page {page_number}: {e}")
+                    snapshot = None
+                if not (check_skip and self.should_skip_page(page_number, snapshot)):
+                    # Wind the mark back over this tab's load and polls, so log_results counts those
+                    # once plus the inspect and screenshot trips since
+                    self.round_trip_mark = polled_at - tab_round_trips[handle]
+                    self.record_page(area, report_name, report_base_url, dataset_name,
+                                     page_number, report_pages_count, page_start, snapshot)
+                if not load_next(handle):
+                    self.driver.close()
+            time.sleep(readiness.poll_interval)
+        self.driver.switch_to.window(main_handle)
+
+    def record_page(self, area, report_name, report_base_url, dataset_name, page_number, report_pages_count, page_start,
+                    snapshot=None):
+        screenshot_name = f"{report_name.replace(' ', '_')}_page_{page_number}.png"
+        os.makedirs(self.screenshots_dir, exist_ok=True)
+        screenshot_path = os.path.join(self.screenshots_dir, screenshot_name)
+        try:
+            # The page has settled, so any error overlay is already in the DOM
+            snapshot = snapshot or self.inspect_page()
+            report_page_url = snapshot["url"]
+            has_report_page_errors = "error" if snapshot["error_overlays"] else "no error"
+        except Exception as e:
+            print(f"Error checking visuals on page {page_number}: {e}")
+            report_page_url = self.driver.current_url
+            has_report_page_errors = "check_failed"
+        try:
+            screenshot_path = self.save_screenshot(screenshot_path)
         except Exception as e:
-            print(f"An error occurred while trying to find close buttons: {e}")
+            print(f"Failed to save screenshot: {e}")
+            screenshot_path = "N/A"
+        if has_report_page_errors == "error":
+            self.has_found_any_errors = "error"
+        self.log_results(
+            area=area,
+            report_name=report_name,
+            dataset_name=dataset_name,
+            report_base_url=report_base_url,
+            url=report_page_url,
+            report_page_number=f"{page_number}/{report_pages_count}",
+            has_report_page_errors=has_report_page_errors,
+            screenshot_path=os.path.relpath(screenshot_path) if screenshot_path != "N/A" else "N/A",
+            time_taken_seconds=time.time() - page_start
+        )
+        print(f"Page {page_number}/{report_pages_count} has page errors: {has_report_page_errors}")
 
-    def get_report_all_pages(self, area, report_name, report_base_url, dataset_name=""):
+    def check_pages_by_url(self, area, report_name, report_base_url, dataset_name, page_urls,
+                           page_numbers=None, report_pages_count=None, check_skip=False):
+        # Page list is already known (REST pre-flight), so go straight to each page
+        page_numbers = page_numbers or list(range(1, len(page_urls) + 1))
+        report_pages_count = report_pages_count or len(page_urls)
+        pending = [(n, url) for n, url in zip(page_numbers, page_urls)
+                   if (report_base_url, n) not in self.completed_pages]
+        if len(pending) < len(page_numbers):
+            print(f"Resuming '{report_name}': {len(page_numbers) - len(pending)} pages already checked")
+        page_numbers = [n for n, url in pending]
+        page_urls = [url for n, url in pending]
+        if self.max_tabs > 1:
+            if page_urls:
+                self.check_pages_in_tabs(area, report_name, report_base_url, dataset_name, page_urls, check_skip,
+                                         page_numbers=page_numbers, report_pages_count=report_pages_count)
+            return
+        for page_number, url in zip(page_numbers, page_urls):
+            page_start = time.time()
+            self.round_trip_mark = self.round_trips()
+            if not self.circuit_allows(area, report_name, report_base_url, dataset_name, url,
+                                       f"{page_number}/{report_pages_count}"):
+                continue
+            try:
+                self.load_report_page_by_url(url, page=self.timing_page(url))
+                self.record_page(area, report_name, report_base_url, dataset_name,
+                                 page_number, report_pages_count, page_start)
+            except Exception as e:
+                print(f"Unexpected error on report page {page_number}: {e}")
+                self.log_results(area, report_name, dataset_name, report_base_url, url,
+                                 f"{page_number}/{report_pages_count}", "check_failed", None, time.time() - page_start)
+
+    @traced("report", label_arg="report_name")
+    def get_report_all_pages(self, area, report_name, report_base_url, dataset_name="", page_urls=None,
+                             page_numbers=None, report_pages_count=None):
+        self.page_readiness = self.readiness.for_report(report_name)
+        self.circuit_key = self.breaker.key(dataset_name, report_base_url) if self.breaker else None
+        self.current_report = report_base_url
+        if not page_urls and not self.circuit_allows(area, report_name, report_base_url, dataset_name,
+                                                     report_base_url, "all"):
+            return
         try:
+            if page_urls:
+                # Inside the try, so a browser that dies in a tab is a fatal_error row (and a retry), not a crashed run
+                self.check_pages_by_url(area, report_name, report_base_url, dataset_name, page_urls,
+                                        page_numbers, report_pages_count)
+                return
             self.load_report_page_by_url(report_base_url)
-            time.sleep(10)
-            start_time = time.time() 
+            limit = self.wait_timeout("nav_list", 10)
             try:
-                mat_action_list = WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.XPATH, "//mat-action-list[@data-testid='pages-navigation-list']"))
-                )
+                wait_start = time.time()
+                with TRACER.span("nav_list_wait"):
+                    mat_action_list = WebDriverWait(self.driver, limit).until(
+                        EC.presence_of_element_located((By.XPATH, "//mat-action-list[@data-testid='pages-navigation-list']"))
+                    )
+                self.record_timing("nav_list", time.time() - wait_start)
                 buttons = mat_action_list.find_elements(By.TAG_NAME, "button")
             except Exception as e:
+                if isinstance(e, TimeoutException):
+                    self.record_timeout("nav_list", limit)
+                print(f"WARNING: no page navigation list in '{report_name}' after {limit:.0f}s ({e.__class__.__name__}), "
+                      f"checking only the page that is showing")
                 buttons = [0] 
+            if self.max_tabs > 1 and type(buttons[0]) != int:
+                page_urls = self.discover_page_urls(report_base_url, buttons)
+                self.check_pages_by_url(area, report_name, report_base_url, dataset_name, page_urls, check_skip=True)
+                return
             current_page_number = 1
             report_pages_count = len(buttons)
-            processed_reports_count = 0
 
             for button in buttons:
+                page_start = time.time()
+                self.round_trip_mark = self.round_trips()
+                if (report_base_url, current_page_number) in self.completed_pages:
+                    print(f"Page {current_page_number} already checked in the interrupted run, skipping")
+                    current_page_number += 1
+                    continue
+                if not self.circuit_allows(area, report_name, report_base_url, dataset_name,
+                                           self.get_report_page_url(report_base_url, current_page_number),
+                                           f"{current_page_number}/{report_pages_count}"):
+                    current_page_number += 1
+                    continue
                 try:
                     if type(button) != int:
+                        previous_url = self.driver.current_url
                         try:
                             button.click()
                             print(f"Navigated to page {current_page_number}")
                         except Exception as e:
                             print(f"Failed to click on page button {current_page_number}: {e}")
                             continue
+                        if current_page_number > 1:
+                            # The route switches just after the click; key the timings by the new section, not the last one
+                            try:
+                                WebDriverWait(self.driver, 5).until(lambda d: d.current_url != previous_url)
+                            except Exception:
+                                pass
 
-                    time.sleep(1)
-                    try:
-                        spans = self.driver.find_elements(By.CSS_SELECTOR, "span.textRun")
-                        span_texts = [span.text.strip().lower() for span in spans if span.text.strip()]
-                        # print(f"Span texts found: {span_texts}")
-
-                        skip_keywords = ["home page", "navigation"]  # Add more keywords if needed
-                        if any(skip_word in text for skip_word in skip_keywords for text in span_texts):
-                            print(f"Skipping page {current_page_number} due to skip keyword match.")
-                            current_page_number += 1
-                            continue
-                    except Exception as e:
-                        print(f"Error checking for skip keywords on page {current_page_number}: {e}")
+                    page = self.timing_page(self.driver.current_url)
+                    self.wait_until_ready(f"(page {current_page_number})", page)
+                    if self.should_skip_page(current_page_number):
+                        current_page_number += 1
+                        continue
 
                     screenshot_name = f"{report_name.replace(' ', '_')}_page_{current_page_number}.png"
                     screenshots_dir = self.screenshots_dir
@@ -209,14 +1058,14 @@ class PowerBIReportProbe:
                     screenshot_path = os.path.join(screenshots_dir, screenshot_name)
 
                     try:
-                        has_report_page_errors = self.has_report_page_error_visuals()
+                        has_report_page_errors = self.has_report_page_error_visuals(self.page_readiness.error_wait, page=page)
                         if has_report_page_errors == "error":
-                            time.sleep(15)
-                            self.driver.save_screenshot(screenshot_path)
+                            self.wait_until_ready(f"(page {current_page_number})", page)
+                            screenshot_path = self.save_screenshot(screenshot_path)
                             end_time = time.time()
-                            time_taken = end_time - start_time
+                            time_taken = end_time - page_start
 
-                            report_page_url = self.driver.current_url
+                            report_page_url = self.page_snapshot["url"]
                             self.log_results(
                                 area=area,
                                 report_name=report_name,
@@ -235,28 +1084,35 @@ class PowerBIReportProbe:
                         print(f"Error checking visuals on page {current_page_number}: {e}")
                         has_report_page_errors = "check_failed"
 
+                    limit = self.wait_timeout("viewport", 180, page)
                     try:
-                        WebDriverWait(self.driver, 180).until(
-                            EC.presence_of_element_located((By.CLASS_NAME, "mid-viewport"))
-                        )
+                        wait_start = time.time()
+                        with TRACER.span("viewport_wait"):
+                            WebDriverWait(self.driver, limit).until(
+                                EC.presence_of_element_located((By.CLASS_NAME, "mid-viewport"))
+                            )
+                        self.record_timing("viewport", time.time() - wait_start, page)
                         print("Page fully loaded with mid-viewport detected.")
                     except Exception as e:
                         print(f"Timeout waiting for mid-viewport:")
+                        if isinstance(e, TimeoutException):
+                            self.record_timeout("viewport", limit, page)
 
-                    report_page_url = self.driver.current_url
                     try:
-                        has_report_page_errors = self.has_report_page_error_visuals()
+                        has_report_page_errors = self.has_report_page_error_visuals(self.page_readiness.error_wait, page=page)
+                        report_page_url = self.page_snapshot["url"]
                     except Exception as e:
                         print(f"Error checking visuals on page {current_page_number}: {e}")
                         has_report_page_errors = "check_failed"
+                        report_page_url = self.driver.current_url
                     try:
-                        self.driver.save_screenshot(screenshot_path)
+                        screenshot_path = self.save_screenshot(screenshot_path)
                     except Exception as e:
                         print(f"Failed to save screenshot: {e}")
                         screenshot_path = "N/A"
 
                     end_time = time.time()  
-                    time_taken = end_time - start_time  
+                    time_taken = end_time - page_start  
 
                     self.log_results(
                         area = area,
@@ -277,13 +1133,6 @@ class PowerBIReportProbe:
                     if has_report_page_errors == "error":
                         self.has_found_any_errors = "error"
                     current_page_number += 1
-                    processed_reports_count += 1
-                    if processed_reports_count % 5 == 0:
-                        try:
-                            print("Closing open reports...")
-                            self.close_open_reports()
-                        except Exception as e:
-                            print(f"Failed to close open reports: {e}")
                 except Exception as e:
                     print(f"Unexpected error on report page {current_page_number}: {e}")
                     current_page_number += 1
@@ -292,13 +1141,16 @@ class PowerBIReportProbe:
             print(f"Fatal error while processing report '{report_name}': {e}")
             screenshot_path = os.path.join(self.screenshots_dir, f"{report_name.replace(' ', '_')}_error.png")
             try:
-                time.sleep(15)
-                self.driver.save_screenshot(screenshot_path)
+                self.wait_until_ready(report_base_url)
+                screenshot_path = self.save_screenshot(screenshot_path)
             except:
                 screenshot_path = "N/A"
             self.log_results(area, report_name, dataset_name, report_base_url, report_base_url, "error", "fatal_error", screenshot_path, 0)
 
-    def log_results(self, area, report_name, dataset_name, report_base_url, url, report_page_number, has_report_page_errors, screenshot_path=None, time_taken_seconds=0):
+    def log_results(self, area, report_name, dataset_name, report_base_url, url, report_page_number, has_report_page_errors, screenshot_path=None, time_taken_seconds=0, round_trips=None):
+        if round_trips is None:
+            round_trips = self.round_trips() - self.round_trip_mark
+        self.round_trip_mark = self.round_trips()
         self.results.append([
             area, 
             report_name,
@@ -308,41 +1160,21 @@ class PowerBIReportProbe:
             report_page_number,
             has_report_page_errors,
             screenshot_path or "N/A",
-            f"{time_taken_seconds:.2f}"
+            f"{time_taken_seconds:.2f}",
+            round_trips
         ])
+        if self.journal:
+            self.journal.record_row(self.results[-1], self.journal_attempt)
+        if str(report_page_number).split("/")[0].isdigit() and has_report_page_errors in ("error", "no error"):
+            self.record_timing("page", time_taken_seconds, self.timing_page(url))
+        # Only pages that were rendered and inspected say something about the dataset; a crashed
+        # browser or failed check (fatal_error, check_failed) must not open its circuit
+        if self.breaker and has_report_page_errors in ("error", "no error"):
+            self.breaker.record(self.circuit_key, has_report_page_errors != "no error")
     
     def show_results(self):
-        df = pd.DataFrame.from_records(self.results)
-        print(df)
-        df.columns = df.iloc[0]
-        df = df[1:]
-        df["url_report"] = df["url_report"].apply(lambda x: f'<a href="{x}" target="_blank">link to report</a>')
-        df["url_page"] = df["url_page"].apply(lambda x: f'<a href="{x}" target="_blank">link to page</a>')
-        
-        # Embed the screenshot as an image in the HTML
-        df["screenshot_path"] = df["screenshot_path"].apply(
-            lambda x: f'<a href="{x}" target="_blank"><img src="{x}" alt="Screenshot" style="width:150px;height:auto;"></a>' if x != "N/A" else "N/A"
-        )
-        html_file_path = os.path.join(os.getcwd(), "result.html")
-        html_table = df.to_html(index=False, escape=False, render_links=True)
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Report Results</title>
-            <link rel="stylesheet" href="style.css">
-        </head>
-        <body>
-            <h1>Power BI Report Validation Results</h1>
-            {html_table}
-        </body>
-        </html>
-        """
-        with open(html_file_path, "w", encoding="utf-8") as file:
-            file.write(html_content)
-        print(f"Results have been saved to {html_file_path}. Open this file to view the results.")
+        html_file_path = ResultsReport(os.path.join(os.getcwd(), "result.html")).write(self.results[1:])
+        print(f"{len(self.results) - 1} page results have been saved to {html_file_path}. Open this file to view the results.")
 
     def quit_driver(self):
         self.close_open_reports()
@@ -352,64 +1184,1872 @@ class PowerBIReportProbe:
             except Exception as e:
                 print(f"Driver quit error: {e}")
 
-def run_reports_in_parallel(excel_files):
-    merged_results = defaultdict(dict)
-    all_keys = set()
+# Outside the working directory, so the cache never ends up next to result.html and the screenshots
+TOKEN_CACHE_FILE = os.path.join(os.getenv("LOCALAPPDATA") or os.path.expanduser("~"), ".pbi_probe", "token_cache.json")
+POWERBI_SCOPE = "https://analysis.windows.net/powerbi/api/.default"
+POWERBI_HOME_URL = "https://app.powerbi.com/home"
+COOKIE_FIELDS = ("name", "value", "domain", "path", "expires", "httpOnly", "secure", "sameSite")
+
+class DataBlob(ctypes.Structure):
+    _fields_ = [("cbData", ctypes.c_uint32), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+def windows_dpapi(data, protect=True):
+    """Encrypt (or decrypt) bytes so only the current Windows user can read them."""
+    crypt32, kernel32 = ctypes.windll.crypt32, ctypes.windll.kernel32
+    buffer = ctypes.create_string_buffer(data, len(data))
+    blob_in = DataBlob(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+    blob_out = DataBlob()
+    call = crypt32.CryptProtectData if protect else crypt32.CryptUnprotectData
+    # 0x1 is CRYPTPROTECT_UI_FORBIDDEN: never prompt, we may run unattended
+    if not call(ctypes.byref(blob_in), None, None, None, None, 0x1, ctypes.byref(blob_out)):
+        raise ctypes.WinError()
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        kernel32.LocalFree(blob_out.pbData)
+
+def interactive_token_fetcher(scope=POWERBI_SCOPE, authority=None):
+    credential = InteractiveBrowserCredential(**({"authority": authority} if authority else {}))
+
+    def fetch():
+        token = credential.get_token(scope)
+        return token.token, token.expires_on
+    return fetch
+
+def endpoint_token_fetcher(token_endpoint, client_id, client_secret, scope=POWERBI_SCOPE, timeout=30):
+    """Client-credentials grant against an OAuth token endpoint (Entra ID or a local stand-in)."""
+    def fetch():
+        response = requests.post(token_endpoint, timeout=timeout, data={
+            "grant_type": "client_credentials",
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "scope": scope,
+        })
+        response.raise_for_status()
+        body = response.json()
+        return body["access_token"], time.time() + float(body.get("expires_in", 3600))
+    return fetch
+
+class SessionCache:
+    """Access token and Power BI sign-in cookies shared by every worker of a run.
+
+    Both are cached in ``token_cache.json`` under the user's (local) app data
+    folder and only fetched again once they are within ``refresh_margin``
+    seconds of expiring. On Windows the file is encrypted with DPAPI for the
+    current user, elsewhere it is plain JSON readable by the owner only. The token comes from
+    ``fetch_token`` (a callable returning ``(token, expires_on)``); cookies
+    are read once through CDP from a browser started by ``sign_in_driver``
+    (normally the signed-in ``AutoProfile_auth`` profile) and set into every
+    pooled browser, so workers need no signed-in profile of their own.
+    """
+
+    def __init__(self, fetch_token, sign_in_driver=None, path=TOKEN_CACHE_FILE, refresh_margin=300,
+                 session_hours=8, sign_in_url=POWERBI_HOME_URL, sign_in_timeout=300):
+        self.fetch_token = fetch_token
+        self.sign_in_driver = sign_in_driver
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self.session_hours = session_hours
+        self.sign_in_url = sign_in_url
+        self.sign_in_timeout = sign_in_timeout
+        self.lock = threading.Lock()
+        self.state = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+            if os.name == "nt" and not data.startswith(b"{"):
+                data = windows_dpapi(data, protect=False)
+            return json.loads(data)
+        except Exception as e:
+            print(f"Ignoring unreadable token cache {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        # The 0o600 mode only protects the file on POSIX; Windows ignores it, so there
+        # the contents are DPAPI-encrypted instead. Written atomically so a crash
+        # never leaves half a token behind
+        data = json.dumps(self.state).encode("utf-8")
+        if os.name == "nt":
+            data = windows_dpapi(data)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o600)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, self.path)
+
+    def _fresh(self, expires_key):
+        return time.time() + self.refresh_margin < self.state.get(expires_key, 0)
+
+    def token(self):
+        with self.lock:
+            if not self._fresh("token_expires_on"):
+                token, expires_on = self.fetch_token()
+                self.state.update(token=token, token_expires_on=expires_on)
+                self._save()
+                print(f"Authenticated, token valid until {datetime.fromtimestamp(expires_on):%H:%M:%S}")
+            return self.state["token"]
+
+    def cookies(self):
+        with self.lock:
+            if not self._fresh("cookies_expire_at"):
+                if not self.sign_in_driver:
+                    return []
+                self._sign_in()
+            return self.state["cookies"]
+
+    def _sign_in(self):
+        driver = self.sign_in_driver()
+        try:
+            driver.get(self.sign_in_url)
+            host = self.sign_in_url.split("/")[2]
+            deadline = time.time() + self.sign_in_timeout
+            # Wait for any login redirects (and MFA prompts) to land back on Power BI
+            while driver.current_url.split("/")[2:3] != [host] or driver.execute_script("return document.readyState") != "complete":
+                if time.time() > deadline:
+                    raise TimeoutError(f"Not signed in to {host} after {self.sign_in_timeout}s")
+                time.sleep(1)
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        finally:
+            driver.quit()
+        captured_at = time.time()
+        expires = [c["expires"] for c in cookies
+                   if not c.get("session") and c.get("expires", -1) > captured_at and "powerbi" in c.get("domain", "")]
+        self.state.update(
+            cookies=[{k: c[k] for k in COOKIE_FIELDS if k in c} for c in cookies],
+            cookies_expire_at=min([captured_at + self.session_hours * 3600] + expires),
+        )
+        self._save()
+        print(f"Captured {len(cookies)} sign-in cookies")
+
+    def inject(self, driver):
+        cookies = self.cookies()
+        if cookies:
+            driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+
+class PowerBIRestClient:
+    """Power BI REST API client that shares one pooled HTTP session across threads.
+
+    ``token`` is a bearer token or a callable returning one, e.g.
+    ``SessionCache.token``, which refreshes it when it is about to expire.
+    """
+
+    def __init__(self, token, base_url="https://api.powerbi.com/v1.0/myorg", pool_size=16, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token = token
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=("GET",), respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path, params=None):
+        token = self.token() if callable(self.token) else self.token
+        response = self.session.get(self.base_url + path, params=params, timeout=self.timeout,
+                                    headers={"Authorization": f"Bearer {token}"})
+        response.raise_for_status()
+        return response.json()
+
+    def _scope(self, group_id):
+        return "" if not group_id or group_id == "me" else f"/groups/{group_id}"
+
+    def get_report(self, group_id, report_id):
+        return self.get(f"{self._scope(group_id)}/reports/{report_id}")
+
+    def get_pages(self, group_id, report_id):
+        return self.get(f"{self._scope(group_id)}/reports/{report_id}/pages").get("value", [])
+
+    def get_last_refresh(self, group_id, dataset_id):
+        refreshes = self.get(f"{self._scope(group_id)}/datasets/{dataset_id}/refreshes", params={"$top": 1})
+        values = refreshes.get("value", [])
+        return values[0] if values else None
+
+def parse_report_url(url):
+    # https://app.powerbi.com/groups/<group>/reports/<report>/ReportSection...
+    match = re.search(r"(.*/groups/([^/]+)/reports/([^/?#]+))", str(url))
+    if not match:
+        return None, None, None
+    return match.group(1), match.group(2), match.group(3)
+
+def parse_refresh_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+@traced("preflight")
+def run_preflight(tasks, client, max_refresh_age_hours=None, workers=8):
+    """Look up pages and dataset refresh state for every report before any browser starts.
+
+    Returns a dict keyed by PBI Link with the visible page URLs, the last dataset
+    refresh and an ``error`` reason for reports that should not be rendered.
+    """
+    def fetch_report(url):
+        base_url, group_id, report_id = parse_report_url(url)
+        meta = {"pages": [], "group_id": group_id, "dataset_key": None,
+                "refresh_status": None, "refreshed_at": None, "error": None}
+        if not report_id:
+            return meta
+        try:
+            report = client.get_report(group_id, report_id)
+            pages = sorted(client.get_pages(group_id, report_id), key=lambda p: p.get("order", 0))
+        except Exception as e:
+            print(f"Pre-flight lookup failed for {url}: {e}")
+            return meta
+        for page in pages:
+            name = page.get("displayName", "").lower()
+            if page.get("visibility") == 1 or any(word in name for word in PowerBIReportProbe.SKIP_KEYWORDS):
+                print(f"Pre-flight skipping page '{page.get('displayName')}' of {report.get('name')}")
+                continue
+            meta["pages"].append(f"{base_url}/{page['name']}")
+        if report.get("datasetId"):
+            meta["dataset_key"] = (report.get("datasetWorkspaceId") or group_id, report["datasetId"])
+        return meta
+
+    def fetch_refresh(dataset_key):
+        try:
+            return client.get_last_refresh(*dataset_key)
+        except Exception as e:
+            print(f"Could not read refresh history for dataset {dataset_key[1]}: {e}")
+            return None
+
+    urls = list(dict.fromkeys(task["url_report"] for task in tasks))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preflight") as executor:
+        metadata = dict(zip(urls, executor.map(fetch_report, urls)))
+        dataset_keys = list({m["dataset_key"] for m in metadata.values() if m["dataset_key"]})
+        refreshes = dict(zip(dataset_keys, executor.map(fetch_refresh, dataset_keys)))
+
+    now = datetime.now(timezone.utc)
+    for meta in metadata.values():
+        refresh = refreshes.get(meta["dataset_key"])
+        if not refresh:
+            continue
+        meta["refresh_status"] = refresh.get("status")
+        meta["refreshed_at"] = refresh.get("endTime")
+        ended = parse_refresh_time(refresh.get("endTime"))
+        if refresh.get("status") == "Failed":
+            meta["error"] = "dataset_refresh_failed"
+        elif max_refresh_age_hours and ended and now - ended > timedelta(hours=max_refresh_age_hours):
+            meta["error"] = "dataset_stale"
+    failed = sum(1 for m in metadata.values() if m["error"])
+    print(f"Pre-flight checked {len(metadata)} reports and {len(dataset_keys)} datasets, {failed} reports on failed or stale datasets")
+    return metadata
+
+STATE_DB_FILE = "probe_state.db"
+FAILED_RESULTS = ("error", "check_failed", "fatal_error", CIRCUIT_OPEN_STATUS, VISUAL_DRIFT_STATUS)
+
+def page_key(url):
+    return str(url).split("?")[0].rstrip("/")
+
+def file_sha256(path):
+    if not path or path == "N/A" or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ProbeStateStore:
+    """Last known result of every report page, kept in SQLite beside result.html.
+
+    Each run records its rows together with the dataset refresh time seen by the
+    pre-flight. ``--incremental`` then only re-probes pages whose dataset has
+    refreshed since, or whose last result was not a clean pass.
+    """
+
+    def __init__(self, path=STATE_DB_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS page_state (
+                url_page TEXT PRIMARY KEY,
+                url_report TEXT,
+                area TEXT,
+                report_name TEXT,
+                dataset_name TEXT,
+                page_nr TEXT,
+                result TEXT,
+                screenshot_path TEXT,
+                screenshot_hash TEXT,
+                time_taken_seconds TEXT,
+                dataset_refreshed_at TEXT,
+                checked_at TEXT
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS page_state_report ON page_state (url_report)")
+        self.conn.commit()
+
+    def record_rows(self, rows, refreshed_at=None):
+        refreshed_at = refreshed_at or {}
+        checked_at = datetime.now(timezone.utc).isoformat()
+        records = [
+            (page_key(row[4]), row[3], row[0], row[1], row[2], row[5], row[6], row[7],
+             file_sha256(row[7]), row[8], refreshed_at.get(row[3]), checked_at)
+            for row in rows
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO page_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+            self.conn.commit()
+
+    def pages_for_report(self, url_report):
+        with self.lock:
+            cursor = self.conn.execute("SELECT * FROM page_state WHERE url_report = ?", (url_report,))
+            columns = [c[0] for c in cursor.description]
+            return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+
+    @staticmethod
+    def needs_recheck(stored, refreshed_at):
+        if stored is None or refreshed_at is None:
+            return True
+        return stored["result"] in FAILED_RESULTS or stored["dataset_refreshed_at"] != refreshed_at
+
+    @staticmethod
+    def to_row(stored, task):
+        return [task["area"], stored["report_name"], stored["dataset_name"], stored["url_report"],
+                stored["url_page"], stored["page_nr"], stored["result"], stored["screenshot_path"] or "N/A",
+                stored["time_taken_seconds"] or "0.00", 0]
+
+    def plan_incremental(self, task, refreshed_at):
+        """Trim ``task`` to the pages that need probing and return rows carried forward."""
+        stored = self.pages_for_report(task["url_report"])
+        if not stored:
+            return []
+        page_urls = task.get("page_urls")
+        if not page_urls:
+            # Page list unknown, so the report is either fully current or fully re-probed
+            if any(self.needs_recheck(s, refreshed_at) for s in stored.values()):
+                return []
+            return [self.to_row(s, task) for s in stored.values()]
+        carried, recheck_urls, recheck_numbers = [], [], []
+        for page_number, url in enumerate(page_urls, start=1):
+            previous = stored.get(page_key(url))
+            if self.needs_recheck(previous, refreshed_at):
+                recheck_urls.append(url)
+                recheck_numbers.append(page_number)
+            else:
+                carried.append(self.to_row(previous, task))
+        task["report_pages_count"] = len(page_urls)
+        task["page_urls"] = recheck_urls
+        task["page_numbers"] = recheck_numbers
+        return carried
+
+JOURNAL_FILE = "probe_journal.jsonl"
+
+class ResultJournal:
+    """Append-only JSONL journal of every result row, flushed as each page is logged.
+
+    A crashed or killed run can be picked up again with ``--resume``: reports
+    marked done are skipped, and so are the pages already logged for reports
+    that were cut off. Rows from an attempt that was retried on a fresh browser
+    are discarded, and short-circuited pages count as not checked yet. The final
+    HTML report and emails are built from the journal.
+    """
+
+    def __init__(self, path=JOURNAL_FILE, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        if not resume and os.path.exists(path):
+            os.remove(path)
+        self.file = open(path, "a", encoding="utf-8")
+        if self.file.tell() and not self._ends_with_newline():
+            self.file.write("\n")  # Previous run died halfway through a line
+        self.append("run_started", resume=resume)
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    def append(self, event, **fields):
+        line = json.dumps({"event": event, "at": time.time(), **fields}, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def record_row(self, row, attempt=None):
+        self.append("page", attempt=attempt, row=row)
+
+    def report_done(self, url_report):
+        self.append("report_done", url_report=url_report)
+
+    def discard_attempt(self, attempt):
+        self.append("discard", attempt=attempt)
+
+    def read(self):
+        rows, discarded, done_reports = [], set(), set()
+        with self.lock, open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Last line of a run that died mid-write
+                if entry["event"] == "page":
+                    rows.append((entry.get("attempt"), entry["row"]))
+                elif entry["event"] == "discard":
+                    discarded.add(entry["attempt"])
+                elif entry["event"] == "report_done":
+                    done_reports.add(entry["url_report"])
+        latest = {}
+        for attempt, row in rows:
+            if attempt is None or attempt not in discarded:
+                latest[(row[2], row[3], row[4])] = row
+        # Short-circuited pages were never checked: a resumed run checks them again, and the
+        # row it logs (possibly under the page's real URL) replaces the circuit-open one
+        checked = {(row[3], row[5]) for row in latest.values() if row[6] != CIRCUIT_OPEN_STATUS}
+        checked_reports = {url_report for url_report, _ in checked}
+        rows = []
+        for row in latest.values():
+            if row[6] == CIRCUIT_OPEN_STATUS:
+                if (row[3], row[5]) in checked or (row[5] == "all" and row[3] in checked_reports):
+                    continue
+                done_reports.discard(row[3])
+            rows.append(row)
+        return rows, done_reports
+
+    def completed_pages(self):
+        pages = set()
+        rows, _ = self.read()
+        for row in rows:
+            page_number = str(row[5]).split("/")[0]
+            if page_number.isdigit() and row[6] != CIRCUIT_OPEN_STATUS:
+                pages.add((row[3], int(page_number)))
+        return pages
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class TimingHistory:
+    """Per-phase wait durations of every report page, kept in probe_state.db.
+
+    Samples are buffered in memory during a run and written by ``flush``; only
+    the most recent ``keep`` samples per (phase, report, page) are kept.
+    """
+
+    def __init__(self, path=STATE_DB_FILE, keep=50):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS page_timings (
+                phase TEXT,
+                url_report TEXT,
+                page TEXT,
+                seconds REAL,
+                recorded_at REAL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS page_timings_key ON page_timings (phase, url_report, page)")
+        self.conn.commit()
+        self.samples = defaultdict(list)
+        for phase, url_report, page, seconds in self.conn.execute(
+                "SELECT phase, url_report, page, seconds FROM page_timings ORDER BY recorded_at"):
+            self.samples[(phase, url_report, page)].append(seconds)
+        self.new_samples = []
+
+    def record(self, phase, url_report, page, seconds):
+        with self.lock:
+            self.new_samples.append((phase, url_report, page, seconds, time.time()))
+
+    def get(self, phase, url_report, page=""):
+        return self.samples.get((phase, url_report, page), [])
+
+    def flush(self):
+        with self.lock:
+            new_samples, self.new_samples = self.new_samples, []
+            self.conn.executemany("INSERT INTO page_timings VALUES (?, ?, ?, ?, ?)", new_samples)
+            self.conn.execute("""
+                DELETE FROM page_timings WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY phase, url_report, page ORDER BY recorded_at DESC) AS n
+                        FROM page_timings)
+                    WHERE n > ?)""", (self.keep,))
+            self.conn.commit()
+
+    def regressions(self, phase="page", recent=5, min_samples=10, ratio=1.5):
+        """Pages whose recent median time is ``ratio`` times their earlier median or worse."""
+        found = []
+        for (sample_phase, url_report, page), samples in self.samples.items():
+            if sample_phase != phase or len(samples) < min_samples:
+                continue
+            before, after = median(samples[:-recent]), median(samples[-recent:])
+            if before > 0 and after / before >= ratio:
+                found.append((url_report, page, before, after, after / before))
+        return sorted(found, key=lambda r: r[4], reverse=True)
+
+class AdaptiveTimeouts:
+    """Sets each wait to p95 of the page's past durations times ``safety_factor``.
+
+    Falls back to the wait's hard-coded default until ``min_samples`` durations
+    have been seen, and always stays between ``floor`` and ``ceiling`` seconds.
+    Waits in ``GATING_PHASES`` decide the result when they time out (a missing
+    report, one page instead of all, a missed error overlay), so they are only
+    ever lengthened: their default is their floor.
+    """
+    GATING_PHASES = ("overlay", "nav_list", "error_overlay")
+
+    def __init__(self, history, safety_factor=2.0, floor=1, ceiling=300, min_samples=5):
+        self.history = history
+        self.safety_factor = safety_factor
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+
+    def timeout(self, phase, url_report, page, default):
+        samples = self.history.get(phase, url_report, page)
+        if len(samples) < self.min_samples:
+            return default
+        p95 = quantiles(samples, n=20, method="inclusive")[18]
+        floor = max(self.floor, default) if phase in self.GATING_PHASES else self.floor
+        return min(max(p95 * self.safety_factor, floor), max(self.ceiling, floor))
+
+def print_timing_regressions(history):
+    regressions = history.regressions()
+    if not regressions:
+        print("No pages with regressing load times.")
+        return
+    print(f"{'before s':>9} {'recent s':>9} {'x':>5}  page")
+    for url_report, page, before, after, ratio in regressions:
+        print(f"{before:>9.2f} {after:>9.2f} {ratio:>5.2f}  {url_report} page {page}")
+
+@functools.lru_cache(maxsize=None)
+def dct_matrix(size):
+    # Orthonormal DCT-II basis, so a 2D DCT is dct @ pixels @ dct.T
+    k = np.arange(size)[:, None]
+    i = np.arange(size)[None, :]
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * i + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+def perceptual_hash(image, hash_size=8, highfreq_factor=4):
+    """64-bit pHash: sign of the low-frequency DCT coefficients of a 32x32 grayscale copy against their median."""
+    size = hash_size * highfreq_factor
+    pixels = np.asarray(image.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+    dct = dct_matrix(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    bits = low > np.median(low.ravel()[1:])  # leave out the DC term, it only tracks brightness
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+def hamming_distances(hashes, baselines):
+    """Bitwise distance between two equally long sequences of 64-bit hashes."""
+    diff = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.asarray(baselines, dtype=np.uint64))
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class VisualBaselineStore:
+    """Perceptual hashes of known-good screenshots per page, in probe_state.db.
+
+    ``check`` hashes the screenshots of pages that passed, compares them with
+    their baselines in one vectorized pass and marks pages more than
+    ``threshold`` bits (of 64) away as ``visual_drift``: blank visuals, "no
+    data" cards or half-rendered pages that raised no error overlay. Pages
+    without a baseline get one; ``update=True`` accepts every current
+    screenshot as the new baseline instead of flagging drift. Baselines are
+    keyed by ``page_key`` so query strings on the page URL do not matter.
+    """
+
+    def __init__(self, path=STATE_DB_FILE, threshold=10, workers=4):
+        self.threshold = threshold
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS visual_baselines (
+                url_page TEXT PRIMARY KEY,
+                phash TEXT,
+                screenshot_path TEXT,
+                updated_at TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def baselines(self, url_pages):
+        with self.lock:
+            stored = dict(self.conn.execute("SELECT url_page, phash FROM visual_baselines").fetchall())
+        return {url_page: int(stored[url_page], 16) for url_page in url_pages if url_page in stored}
+
+    def save(self, records):
+        updated_at = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO visual_baselines VALUES (?, ?, ?, ?)",
+                                  [(url_page, f"{phash:016x}", path, updated_at) for url_page, phash, path in records])
+            self.conn.commit()
+
+    @staticmethod
+    def hash_file(path):
+        try:
+            # The thumbnail holds plenty of detail for a 32x32 hash and decodes much faster
+            with Image.open(thumbnail_for(path)) as image:
+                return perceptual_hash(image)
+        except Exception as e:
+            print(f"Could not hash screenshot {path}: {e}")
+            return None
+
+    @traced("visual_check")
+    def check(self, rows, update=False):
+        """Mark drifted result rows as visual_drift in place; returns the drifted rows."""
+        rows = [row for row in rows if str(row[6]).strip() == "no error"
+                and row[7] and row[7] != "N/A" and os.path.exists(row[7])]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="phash") as executor:
+            hashes = list(executor.map(self.hash_file, [row[7] for row in rows]))
+        hashed = [(row, page_key(row[4]), h) for row, h in zip(rows, hashes) if h is not None]
+        baselines = {} if update else self.baselines([key for _, key, _ in hashed])
+        compared = [(row, key, h) for row, key, h in hashed if key in baselines]
+        new = [(key, h, row[7]) for row, key, h in hashed if key not in baselines]
+        drifted = []
+        if compared:
+            distances = hamming_distances([h for _, _, h in compared], [baselines[key] for _, key, _ in compared])
+            for (row, _, _), distance in zip(compared, distances):
+                if distance > self.threshold:
+                    print(f"Visual drift on '{row[1]}' page {row[5]}: {distance} of 64 bits differ from the baseline")
+                    row[6] = VISUAL_DRIFT_STATUS
+                    drifted.append(row)
+        self.save(new)
+        print(f"Visual check: {len(compared)} pages compared, {len(drifted)} drifted, {len(new)} baselines "
+              f"{'updated' if update else 'added'}")
+        return drifted
+
+def load_report_tasks(excel_files):
+    tasks = []
+    for excel_file in excel_files:
+        area = os.path.splitext(excel_file)[0].lower()
+        df = pd.read_excel(excel_file)
+        for index, report in df.iterrows():
+            tasks.append({
+                "area": area,
+                "report_name": report["PBI Report Name"],
+                "url_report": report["PBI Link"],
+                "dataset_name": report["PBI Dataset Name"],
+            })
+    return tasks
+
+def load_report_durations(path=REPORT_DURATIONS_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except Exception as e:
+        print(f"Could not read report durations from {path}: {e}")
+        return {}
+
+def save_report_durations(durations, path=REPORT_DURATIONS_FILE):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(durations, file, indent=2, sort_keys=True)
+
+class ReportScheduler:
+    """Hands report tasks from every workbook to a pool of browser workers.
+
+    Tasks are dealt longest-expected-first onto per-worker queues, balancing the
+    expected work of each queue. Durations come from previous runs; reports we
+    have never timed are assumed to take the average. A worker whose own queue
+    is empty steals from the back of the queue with the most work left.
+    """
+    DEFAULT_DURATION = 60
+
+    def __init__(self, tasks, workers, durations=None):
+        self.durations = dict(durations or {})
+        known = list(self.durations.values())
+        self.default_duration = sum(known) / len(known) if known else self.DEFAULT_DURATION
+        self.lock = threading.Lock()
+        self.queues = [deque() for _ in range(workers)]
+        self.remaining = [0.0] * workers
+        for task in sorted(tasks, key=self.expected_duration, reverse=True):
+            worker_id = self.remaining.index(min(self.remaining))
+            self.queues[worker_id].append(task)
+            self.remaining[worker_id] += self.expected_duration(task)
+
+    def expected_duration(self, task):
+        return self.durations.get(task["url_report"], self.default_duration)
+
+    def next_task(self, worker_id):
+        with self.lock:
+            queue = self.queues[worker_id]
+            if queue:
+                task = queue.popleft()
+            else:
+                # Expected work can stay above zero once a queue is empty, so only look at queues with tasks
+                candidates = [i for i, q in enumerate(self.queues) if q]
+                if not candidates:
+                    return None
+                victim = max(candidates, key=lambda i: self.remaining[i])
+                task = self.queues[victim].pop()
+                print(f"Worker {worker_id} stole '{task['report_name']}' from worker {victim}")
+                worker_id = victim
+            self.remaining[worker_id] -= self.expected_duration(task)
+            return task
+
+    def requeue(self, worker_id, task):
+        with self.lock:
+            self.queues[worker_id].appendleft(task)
+            self.remaining[worker_id] += self.expected_duration(task)
+
+    def record_duration(self, task, seconds):
+        with self.lock:
+            previous = self.durations.get(task["url_report"])
+            self.durations[task["url_report"]] = seconds if previous is None else (previous + seconds) / 2
+
+    def report_done(self, worker_id, task, rows):
+        # Rows stay with the worker until the run ends; see QueueScheduler for the distributed case
+        pass
+
+    def unassigned(self):
+        """Take every task no worker got to."""
+        with self.lock:
+            tasks = [task for queue in self.queues for task in queue]
+            for queue in self.queues:
+                queue.clear()
+            self.remaining = [0.0] * len(self.queues)
+        return tasks
+
+def queue_file_path(name):
+    # Files travel between hosts as relative paths; never let one escape the run directory
+    path = os.path.normpath(name)
+    if os.path.isabs(path) or path.startswith(".."):
+        raise ValueError(f"Refusing to store file outside the run directory: {name}")
+    return path
+
+class WorkQueue(ABC):
+    """Report tasks shared by a coordinator and any number of worker hosts.
+
+    The coordinator ``put``s tasks and ``take_results``; workers ``lease`` a
+    task for ``seconds``, ``renew`` the lease while they work and ``complete``
+    it with the result rows and screenshot files (relative path -> bytes).
+    A lease that runs out goes back to the queue, so a worker that dies only
+    costs its current report. The first ``complete`` of a task wins.
+    """
+
+    @abstractmethod
+    def put(self, tasks):
+        """Add report tasks to the queue."""
+
+    @abstractmethod
+    def lease(self, worker, seconds):
+        """Return ``(task_id, task)`` or None when nothing is pending."""
+
+    @abstractmethod
+    def renew(self, task_id, worker, seconds):
+        """Extend a held lease; False when the worker no longer holds it."""
+
+    @abstractmethod
+    def release(self, task_id, worker):
+        """Give a leased task back unfinished."""
+
+    @abstractmethod
+    def complete(self, task_id, worker, rows, files):
+        """Store the result of a leased task."""
+
+    @abstractmethod
+    def requeue_expired(self):
+        """Return tasks with a run-out lease to the queue; the number requeued."""
+
+    @abstractmethod
+    def remaining(self):
+        """Tasks not completed yet, leased or not."""
+
+    @abstractmethod
+    def take_results(self):
+        """``(task, rows, files)`` of every task completed since the last call."""
+
+class SQLiteWorkQueue(WorkQueue):
+    """Work queue in one SQLite file, for workers on this host or a shared drive."""
+
+    def __init__(self, path="work_queue.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY, payload TEXT, state TEXT, worker TEXT,
+                    lease_expires REAL, attempts INTEGER DEFAULT 0);
+                CREATE TABLE IF NOT EXISTS results (task_id TEXT PRIMARY KEY, rows TEXT, collected INTEGER DEFAULT 0);
+                CREATE TABLE IF NOT EXISTS files (task_id TEXT, name TEXT, data BLOB);
+            """)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def put(self, tasks):
+        records = [(uuid.uuid4().hex, json.dumps(task, default=str)) for task in tasks]
+        with self.transaction() as conn:
+            conn.executemany("INSERT INTO tasks (id, payload, state) VALUES (?, ?, 'pending')", records)
+        return [task_id for task_id, _ in records]
+
+    def lease(self, worker, seconds):
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT id, payload FROM tasks WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                "ORDER BY rowid LIMIT 1", (now,)).fetchone()
+            if not row:
+                return None
+            conn.execute("UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                         "WHERE id = ?", (worker, now + seconds, row[0]))
+        return row[0], json.loads(row[1])
+
+    def renew(self, task_id, worker, seconds):
+        with self.transaction() as conn:
+            cursor = conn.execute("UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                                  (time.time() + seconds, task_id, worker))
+        return cursor.rowcount == 1
+
+    def release(self, task_id, worker):
+        with self.transaction() as conn:
+            conn.execute("UPDATE tasks SET state = 'pending', worker = NULL WHERE id = ? AND worker = ? AND state = 'leased'",
+                         (task_id, worker))
+
+    def complete(self, task_id, worker, rows, files):
+        with self.transaction() as conn:
+            state = conn.execute("SELECT state FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if not state or state[0] == "done":
+                return False
+            conn.execute("UPDATE tasks SET state = 'done', worker = ? WHERE id = ?", (worker, task_id))
+            conn.execute("INSERT INTO results (task_id, rows) VALUES (?, ?)", (task_id, json.dumps(rows, default=str)))
+            conn.executemany("INSERT INTO files (task_id, name, data) VALUES (?, ?, ?)",
+                             [(task_id, queue_file_path(name), data) for name, data in files.items()])
+        return True
+
+    def requeue_expired(self):
+        with self.transaction() as conn:
+            cursor = conn.execute("UPDATE tasks SET state = 'pending', worker = NULL "
+                                  "WHERE state = 'leased' AND lease_expires < ?", (time.time(),))
+        return cursor.rowcount
+
+    def remaining(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM tasks WHERE state != 'done'").fetchone()[0]
+
+    def take_results(self):
+        with self.transaction() as conn:
+            records = conn.execute(
+                "SELECT r.task_id, t.payload, r.rows FROM results r JOIN tasks t ON t.id = r.task_id "
+                "WHERE r.collected = 0").fetchall()
+            results = []
+            for task_id, payload, rows in records:
+                files = dict(conn.execute("SELECT name, data FROM files WHERE task_id = ?", (task_id,)).fetchall())
+                results.append((json.loads(payload), json.loads(rows), files))
+                conn.execute("UPDATE results SET collected = 1 WHERE task_id = ?", (task_id,))
+                conn.execute("DELETE FROM files WHERE task_id = ?", (task_id,))
+        return results
+
+class FileWorkQueue(WorkQueue):
+    """Work queue as files in a directory, e.g. on a network share.
+
+    Every state change is a single atomic rename: ``pending/<id>.json`` is
+    leased by renaming it to ``leased/<id>@<expires>@<worker>.json``, renewed
+    by renaming it to a later expiry and requeued by renaming it back.
+    Results go to ``results/<id>/`` and are committed by writing ``rows.json``.
+    """
+
+    def __init__(self, directory="work_queue"):
+        self.directory = directory
+        for name in ("pending", "leased", "done", "results"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def _write_json(self, path, data):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, default=str)
+        os.replace(tmp_path, path)
+
+    def _leases(self, task_id=None):
+        for name in os.listdir(self._path("leased")):
+            if not name.endswith(".json"):
+                continue
+            lease_id, expires, worker = name[:-len(".json")].split("@", 2)
+            if task_id is None or lease_id == task_id:
+                yield name, lease_id, float(expires), worker
+
+    def _lease_name(self, task_id, worker, seconds):
+        return f"{task_id}@{time.time() + seconds:.0f}@{re.sub(r'[^A-Za-z0-9_.-]', '_', worker)}.json"
+
+    def put(self, tasks):
+        task_ids = []
+        for task in tasks:
+            # Names sort in the order tasks were put, so workers lease them in that order
+            task_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+            self._write_json(self._path("pending", f"{task_id}.json"), task)
+            task_ids.append(task_id)
+        return task_ids
+
+    def lease(self, worker, seconds):
+        for name in sorted(os.listdir(self._path("pending"))):
+            if not name.endswith(".json"):
+                continue
+            task_id = name[:-len(".json")]
+            leased = self._path("leased", self._lease_name(task_id, worker, seconds))
+            try:
+                os.rename(self._path("pending", name), leased)
+            except OSError:
+                continue  # another worker got there first
+            with open(leased, "r", encoding="utf-8") as file:
+                return task_id, json.load(file)
+        return None
+
+    def renew(self, task_id, worker, seconds):
+        for name, _, _, lease_worker in self._leases(task_id):
+            if lease_worker == re.sub(r'[^A-Za-z0-9_.-]', '_', worker):
+                try:
+                    os.rename(self._path("leased", name), self._path("leased", self._lease_name(task_id, worker, seconds)))
+                    return True
+                except OSError:
+                    return False
+        return False
+
+    def release(self, task_id, worker):
+        for name, _, _, _ in self._leases(task_id):
+            try:
+                os.rename(self._path("leased", name), self._path("pending", f"{task_id}.json"))
+            except OSError:
+                pass
+
+    def _read_task(self, task_id):
+        for _ in range(3):
+            candidates = [self._path("leased", name) for name, _, _, _ in self._leases(task_id)]
+            candidates += [self._path(folder, f"{task_id}.json") for folder in ("pending", "done")]
+            for path in candidates:
+                try:
+                    with open(path, "r", encoding="utf-8") as file:
+                        return json.load(file)
+                except OSError:
+                    continue  # renamed under us by a renew or requeue
+        raise FileNotFoundError(f"Task {task_id} is not in the queue")
+
+    def _retire(self, task_id):
+        for name, _, _, _ in list(self._leases(task_id)):
+            try:
+                os.replace(self._path("leased", name), self._path("done", f"{task_id}.json"))
+            except OSError:
+                pass
+        try:
+            os.replace(self._path("pending", f"{task_id}.json"), self._path("done", f"{task_id}.json"))
+        except OSError:
+            pass
+
+    def complete(self, task_id, worker, rows, files):
+        result_dir = self._path("results", task_id)
+        rows_path = os.path.join(result_dir, "rows.json")
+        if os.path.exists(rows_path):
+            self._retire(task_id)
+            return False
+        task = self._read_task(task_id)
+        for name, data in files.items():
+            path = os.path.join(result_dir, "files", queue_file_path(name))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(data)
+        os.makedirs(result_dir, exist_ok=True)
+        # rows.json commits the result; only then does the task stop counting as remaining
+        self._write_json(rows_path, {"task": task, "rows": rows})
+        self._retire(task_id)
+        return True
+
+    def requeue_expired(self):
+        requeued = 0
+        now = time.time()
+        for name, task_id, expires, _ in list(self._leases()):
+            if expires < now:
+                try:
+                    os.rename(self._path("leased", name), self._path("pending", f"{task_id}.json"))
+                    requeued += 1
+                except OSError:
+                    pass
+        return requeued
+
+    def remaining(self):
+        return sum(1 for folder in ("pending", "leased") for name in os.listdir(self._path(folder)) if name.endswith(".json"))
+
+    def take_results(self):
+        results = []
+        for task_id in os.listdir(self._path("results")):
+            result_dir = self._path("results", task_id)
+            rows_path = os.path.join(result_dir, "rows.json")
+            collected = os.path.join(result_dir, "collected")
+            if not os.path.exists(rows_path) or os.path.exists(collected):
+                continue
+            with open(rows_path, "r", encoding="utf-8") as file:
+                result = json.load(file)
+            files = {}
+            files_dir = os.path.join(result_dir, "files")
+            for root, _, names in os.walk(files_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    with open(path, "rb") as file:
+                        files[os.path.relpath(path, files_dir)] = file.read()
+            open(collected, "w").close()
+            results.append((result["task"], result["rows"], files))
+        return results
+
+def open_work_queue(location):
+    # A .db file is an SQLite queue, anything else a queue directory
+    if location.endswith(".db"):
+        return SQLiteWorkQueue(location)
+    return FileWorkQueue(location)
+
+class QueueScheduler:
+    """ReportScheduler stand-in that leases report tasks from a WorkQueue.
+
+    Used by worker hosts: ``next_task`` waits for a lease until the queue is
+    drained, a heartbeat thread renews held leases every third of
+    ``lease_seconds`` and ``report_done`` pushes rows and screenshots back.
+    """
+
+    def __init__(self, work_queue, worker_name, screenshots=None, lease_seconds=900, poll_interval=5):
+        self.work_queue = work_queue
+        self.worker_name = worker_name
+        self.screenshots = screenshots
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.durations = {}
+        self.lock = threading.Lock()
+        self.held = {}
+        self.stopped = threading.Event()
+        self.heartbeat = threading.Thread(target=self._renew_leases, name="lease-heartbeat", daemon=True)
+        self.heartbeat.start()
+
+    def _worker(self, worker_id):
+        return f"{self.worker_name}-{worker_id}"
+
+    def _renew_leases(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.lock:
+                held = list(self.held.items())
+            for task_id, worker in held:
+                if not self.work_queue.renew(task_id, worker, self.lease_seconds):
+                    print(f"Lost the lease on task {task_id}, another worker may run it again")
+
+    def next_task(self, worker_id):
+        while True:
+            with self.lock:
+                leased = self.work_queue.lease(self._worker(worker_id), self.lease_seconds)
+            if leased:
+                task_id, task = leased
+                with self.lock:
+                    self.held[task_id] = self._worker(worker_id)
+                task["task_id"] = task_id
+                print(f"Worker {self._worker(worker_id)} leased '{task['report_name']}'")
+                return task
+            if self.work_queue.remaining() == 0:
+                return None
+            # Everything left is leased elsewhere; wait in case a lease expires
+            self.stopped.wait(self.poll_interval)
+
+    def requeue(self, worker_id, task):
+        with self.lock:
+            self.held.pop(task["task_id"], None)
+        self.work_queue.release(task["task_id"], self._worker(worker_id))
+
+    def record_duration(self, task, seconds):
+        with self.lock:
+            self.durations[task["url_report"]] = seconds
+
+    def report_done(self, worker_id, task, rows):
+        if self.screenshots:
+            self.screenshots.flush()
+        files = {}
+        for row in rows:
+            for path in (row[7], thumbnail_for(row[7])):
+                if path and path != "N/A" and os.path.exists(path):
+                    with open(path, "rb") as file:
+                        files[path] = file.read()
+        with self.lock:
+            self.held.pop(task["task_id"], None)
+        self.work_queue.complete(task["task_id"], self._worker(worker_id), [list(row) for row in rows], files)
+
+    def unassigned(self):
+        # Released tasks stay on the shared queue for the other worker hosts
+        return []
+
+    def close(self):
+        self.stopped.set()
+
+def collect_queue_results(work_queue, journal=None, poll_interval=5):
+    """Coordinator side: wait for every queued report, requeue expired leases and gather rows and screenshots."""
+    rows = []
+    while True:
+        # Results are committed before a task stops counting as remaining, so this take gets the last ones
+        drained = work_queue.remaining() == 0
+        requeued = work_queue.requeue_expired()
+        if requeued:
+            print(f"Requeued {requeued} reports whose lease expired")
+        for task, task_rows, files in work_queue.take_results():
+            for name, data in files.items():
+                path = queue_file_path(name)
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as file:
+                    file.write(data)
+            if journal:
+                for row in task_rows:
+                    journal.record_row(row)
+                journal.report_done(task["url_report"])
+            rows.extend(task_rows)
+            print(f"Collected {len(task_rows)} pages of '{task['report_name']}'")
+        if drained:
+            return rows
+        time.sleep(poll_interval)
+class PooledDriver:
+    def __init__(self, slot, driver):
+        self.slot = slot
+        self.driver = driver
+        self.pages = 0
+        self.healthy = True
+
+class DriverPool:
+    """Pre-warmed browser sessions handed out to the report workers.
+
+    All sessions start in parallel up front. A session is health-checked on every
+    checkout and recycled (quit and started again on the same profile slot) once
+    it has rendered ``max_pages`` pages or its process tree passes ``max_rss_mb``.
+    This replaces clicking close buttons to keep Edge's memory in check.
+    """
+
+    def __init__(self, size, factory, max_pages=50, max_rss_mb=None):
+        self.size = size
+        self.factory = factory
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.available = queue.Queue()
+        self.leases = []
+
+    @traced("driver_pool_start")
+    def start(self):
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="driver-start") as executor:
+            futures = {executor.submit(self.factory, slot): slot for slot in range(self.size)}
+            for future, slot in futures.items():
+                try:
+                    lease = PooledDriver(slot, future.result())
+                except Exception as e:
+                    print(f"Failed to start browser for slot {slot}: {e}")
+                    continue
+                self.leases.append(lease)
+                self.available.put(lease)
+        if not self.leases:
+            raise RuntimeError("No browser session could be started")
+        print(f"Started {len(self.leases)} browser sessions in {time.time() - start_time:.2f}s")
+        return self
+
+    def is_healthy(self, driver):
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def rss_mb(self, driver):
+        try:
+            process = psutil.Process(driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except Exception:
+            return 0
+
+    def restart(self, lease):
+        try:
+            lease.driver.quit()
+        except Exception as e:
+            print(f"Driver quit error: {e}")
+        lease.driver = self.factory(lease.slot)
+        lease.pages = 0
+        lease.healthy = True
+
+    def acquire(self):
+        lease = self.available.get()
+        if not lease.healthy or not self.is_healthy(lease.driver):
+            print(f"Browser session in slot {lease.slot} is not responding, restarting")
+            try:
+                self.restart(lease)
+            except Exception:
+                # Hand the slot back so the next acquire tries again instead of blocking forever
+                lease.healthy = False
+                self.available.put(lease)
+                raise
+        return lease
+
+    def release(self, lease):
+        reason = None
+        if lease.pages >= self.max_pages:
+            reason = f"{lease.pages} pages"
+        elif self.max_rss_mb:
+            rss = self.rss_mb(lease.driver)
+            if rss > self.max_rss_mb:
+                reason = f"{rss:.0f} MB RSS"
+        if reason:
+            print(f"Recycling browser session in slot {lease.slot} after {reason}")
+            try:
+                self.restart(lease)
+            except Exception as e:
+                # acquire() will try again with the next health check
+                print(f"Failed to restart browser for slot {lease.slot}: {e}")
+                lease.healthy = False
+        self.available.put(lease)
+
+    def close(self):
+        for lease in self.leases:
+            try:
+                lease.driver.quit()
+            except Exception as e:
+                print(f"Failed to quit driver: {e}")
+
+def area_key(area):
+    # "Finance Reports.xlsx" and "finance reports" both belong to the finance area
+    return os.path.splitext(str(area))[0].split()[0].lower()
+
+class ResultSet:
+    """Page results stored column by column and indexed by (url_report, url_page).
+
+    Adding a row for a page that is already present replaces it, so merging the
+    rows of all workers is linear. ``summarize`` walks the rows once and yields
+    the per-area, per-dataset totals and error rows used by the emails.
+    """
+    COLUMNS = PowerBIReportProbe.RESULT_COLUMNS
+
+    def __init__(self, rows=None):
+        self.columns = {name: [] for name in self.COLUMNS}
+        self.index = {}
+        for row in rows or []:
+            self.add(row)
+
+    def add(self, row):
+        key = (row[3], row[4])
+        position = self.index.get(key)
+        if position is None:
+            self.index[key] = len(self)
+            for name, value in zip(self.COLUMNS, row):
+                self.columns[name].append(value)
+        else:
+            for name, value in zip(self.COLUMNS, row):
+                self.columns[name][position] = value
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def __len__(self):
+        return len(self.columns["url_page"])
+
+    def __iter__(self):
+        return (list(row) for row in zip(*self.columns.values()))
+
+    def get(self, url_report, url_page):
+        position = self.index.get((url_report, url_page))
+        if position is None:
+            return None
+        return [self.columns[name][position] for name in self.COLUMNS]
+
+    def sorted(self):
+        columns = self.columns
+        order = sorted(range(len(self)), key=lambda i: (str(columns["dataset_name"][i]),
+                                                        str(columns["url_report"][i]),
+                                                        str(columns["url_page"][i])))
+        result = ResultSet()
+        result.columns = {name: [values[i] for i in order] for name, values in columns.items()}
+        result.index = {(result.columns["url_report"][i], result.columns["url_page"][i]): i for i in range(len(result))}
+        return result
+
+    def has_errors(self):
+        return any(str(status).strip() in ("error", VISUAL_DRIFT_STATUS) for status in self.columns["has_report_page_errors"])
+
+    def to_records(self):
+        return [list(self.COLUMNS)] + list(self)
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.columns, columns=self.COLUMNS)
+
+    def summarize(self):
+        summary = {}
+        for row in self:
+            area = summary.setdefault(area_key(row[0]), {"datasets": {}, "errors": []})
+            stats = area["datasets"].setdefault(row[2], {"total": 0, "errors": 0, "short_circuited": 0})
+            status = str(row[6]).strip().lower()
+            if status == CIRCUIT_OPEN_STATUS:
+                # Not rendered, so counted apart from the pages we actually checked
+                stats["short_circuited"] += 1
+                continue
+            stats["total"] += 1
+            if status in ("error", VISUAL_DRIFT_STATUS):
+                stats["errors"] += 1
+                area["errors"].append(row)
+        return summary
+
+def thumbnail_for(screenshot_path):
+    thumbnail_path = os.path.join(os.path.dirname(screenshot_path), "thumbs",
+                                  os.path.splitext(os.path.basename(screenshot_path))[0] + ".jpg")
+    return thumbnail_path if os.path.exists(thumbnail_path) else screenshot_path
+
+def screenshot_attachments(paths, max_bytes=15 * 1024 * 1024):
+    """Pick attachments for an email without going over ``max_bytes``.
+
+    Full screenshots are used while they fit, thumbnails after that; anything
+    that does not fit at all is left out and stays linked from result.html.
+    """
+    attachments, total = [], 0
+    for path in dict.fromkeys(paths):
+        for candidate in (path, thumbnail_for(path)):
+            if not os.path.exists(candidate):
+                continue
+            size = os.path.getsize(candidate)
+            if total + size <= max_bytes:
+                attachments.append(candidate)
+                total += size
+                break
+        else:
+            print(f"Attachment budget reached, leaving out {path}")
+    return attachments
+
+RESULTS_PAGE_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Report Results{page_title}</title>
+    <link rel="stylesheet" href="style.css">
+</head>
+<body>
+    <h1>Power BI Report Validation Results</h1>
+    <div class="filters">
+        <input id="search" type="search" placeholder="Search all pages: report, dataset, area or status">
+        <label><input id="errors-only" type="checkbox"> Errors only</label>
+        <div id="matches"></div>
+    </div>
+"""
+
+RESULTS_PAGE_SCRIPT = """<script src="{data_file}"></script>
+<script>
+(function () {
+    var search = document.getElementById('search'), matches = document.getElementById('matches');
+    document.getElementById('errors-only').onchange = function (e) {
+        document.body.classList.toggle('errors-only', e.target.checked);
+    };
+    search.oninput = function () {
+        var q = search.value.toLowerCase(), c = RESULTS.columns, out = [];
+        matches.innerHTML = '';
+        if (q.length < 2) { return; }
+        for (var i = 0; i < RESULTS.rows.length && out.length < 200; i++) {
+            var r = RESULTS.rows[i];
+            var text = [r[c.area], r[c.report_name], r[c.dataset_name], r[c.has_report_page_errors]].join(' ').toLowerCase();
+            if (text.indexOf(q) >= 0) { out.push(r); }
+        }
+        out.forEach(function (r) {
+            var a = document.createElement('a');
+            a.href = RESULTS.pages[r[c.report]];
+            a.textContent = r[c.report_name] + ' / page ' + r[c.page_num] + ' - ' + r[c.has_report_page_errors];
+            matches.appendChild(a);
+        });
+    };
+    // Search results link into groups that may be collapsed; expand the way to the report
+    function reveal() {
+        var target = location.hash && document.getElementById(location.hash.slice(1));
+        for (var el = target; el; el = el.parentElement) {
+            if (el.tagName === 'DETAILS') { el.open = true; }
+        }
+        if (target) { target.scrollIntoView(); }
+    }
+    window.addEventListener('hashchange', reveal);
+    reveal();
+})();
+</script>
+</body>
+</html>
+"""
+
+class ResultsReport:
+    """Writes result.html grouped by area, dataset and report, errors first.
+
+    Rows are streamed to disk group by group and split over several HTML
+    files of ``reports_per_page`` reports each; only groups with errors are
+    expanded and thumbnails load lazily. A compact copy of every row goes to
+    ``result_data.js`` so the search box can filter across all files.
+    """
+
+    def __init__(self, path="result.html", reports_per_page=500, data_file="result_data.js"):
+        self.path = path
+        self.reports_per_page = reports_per_page
+        self.data_file = data_file
+
+    def page_path(self, number):
+        stem, ext = os.path.splitext(self.path)
+        return self.path if number == 1 else f"{stem}_{number}{ext}"
+
+    @staticmethod
+    def is_error(row):
+        return str(row[6]).strip() in FAILED_RESULTS
+
+    def group(self, rows):
+        # area -> dataset -> url_report -> rows, built in one pass
+        areas = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+        for row in rows:
+            areas[str(row[0])][str(row[2])][row[3]].append(row)
+        reports = []
+        for area in sorted(areas):
+            datasets = areas[area]
+            failed = {d: sum(self.is_error(r) for rs in datasets[d].values() for r in rs) for d in datasets}
+            for dataset in sorted(datasets, key=lambda d: (-failed[d], d)):
+                by_report = datasets[dataset]
+                ordered = sorted(by_report.items(),
+                                 key=lambda item: (-sum(self.is_error(r) for r in item[1]), str(item[1][0][1])))
+                for url_report, report_rows in ordered:
+                    reports.append((area, dataset, url_report, report_rows))
+        return reports
+
+    @traced("results_report")
+    def write(self, rows):
+        reports = self.group(rows)
+        page_count = max(1, -(-len(reports) // self.reports_per_page))
+        data = {"columns": {name: i for i, name in enumerate(PowerBIReportProbe.RESULT_COLUMNS)},
+                "pages": [], "rows": []}
+        data["columns"]["report"] = len(PowerBIReportProbe.RESULT_COLUMNS)
+        for number in range(1, page_count + 1):
+            chunk = reports[(number - 1) * self.reports_per_page:number * self.reports_per_page]
+            with open(self.page_path(number), "w", encoding="utf-8") as file:
+                file.write(RESULTS_PAGE_HEAD.format(page_title=f" ({number}/{page_count})" if page_count > 1 else ""))
+                self._write_nav(file, number, page_count)
+                self._write_groups(file, chunk, number, data)
+                self._write_nav(file, number, page_count)
+                file.write(RESULTS_PAGE_SCRIPT.replace("{data_file}", html.escape(os.path.basename(self.data_file))))
+        data_path = os.path.join(os.path.dirname(self.path), self.data_file)
+        with open(data_path, "w", encoding="utf-8") as file:
+            file.write("var RESULTS = ")
+            json.dump(data, file, separators=(",", ":"), default=str)
+            file.write(";\n")
+        return self.path
+
+    def _write_nav(self, file, number, page_count):
+        if page_count < 2:
+            return
+        links = " ".join(f"<b>{n}</b>" if n == number else
+                         f'<a href="{os.path.basename(self.page_path(n))}">{n}</a>' for n in range(1, page_count + 1))
+        file.write(f'<nav class="pager">Page {links}</nav>\n')
+
+    def _write_groups(self, file, reports, number, data):
+        page_file = os.path.basename(self.page_path(number))
+        # Area and dataset groups start expanded only when they hold a failed report
+        failing = {(area, dataset) for area, dataset, _, report_rows in reports
+                   if any(self.is_error(r) for r in report_rows)}
+        failing_areas = {area for area, _ in failing}
+        open_area = open_dataset = None
+        for area, dataset, url_report, report_rows in reports:
+            if area != open_area:
+                if open_dataset is not None:
+                    file.write("</details>\n")
+                if open_area is not None:
+                    file.write("</details>\n")
+                file.write(f'<details class="area"{" open" if area in failing_areas else ""}>'
+                           f'<summary>{html.escape(area.upper())}</summary>\n')
+                open_area, open_dataset = area, None
+            if dataset != open_dataset:
+                if open_dataset is not None:
+                    file.write("</details>\n")
+                file.write(f'<details class="dataset"{" open" if (area, dataset) in failing else ""}>'
+                           f'<summary>{html.escape(dataset)}</summary>\n')
+                open_dataset = dataset
+            errors = sum(self.is_error(r) for r in report_rows)
+            anchor = f"r{len(data['pages'])}"
+            data["pages"].append(f"{page_file}#{anchor}")
+            file.write(f'<details id="{anchor}" class="report{" failed" if errors else ""}"{" open" if errors else ""}>'
+                       f'<summary>{html.escape(str(report_rows[0][1]))} '
+                       f'<span class="counts">{errors} errors / {len(report_rows)} pages</span> '
+                       f'<a href="{html.escape(str(url_report))}" target="_blank">open report</a></summary>\n')
+            file.write('<table class="dataframe"><thead><tr><th>Page</th><th>Status</th><th>Time (s)</th>'
+                       '<th>Screenshot</th></tr></thead><tbody>\n')
+            for row in sorted(report_rows, key=lambda r: not self.is_error(r)):
+                data["rows"].append(list(row[:len(PowerBIReportProbe.RESULT_COLUMNS)]) + [len(data["pages"]) - 1])
+                file.write(self._row_html(row))
+            file.write("</tbody></table></details>\n")
+        if open_dataset is not None:
+            file.write("</details>\n")
+        if open_area is not None:
+            file.write("</details>\n")
+
+    def _row_html(self, row):
+        screenshot = row[7]
+        if screenshot and screenshot != "N/A":
+            shot = (f'<a href="{html.escape(screenshot)}" target="_blank"><img src="{html.escape(thumbnail_for(screenshot))}" '
+                    f'alt="Screenshot" loading="lazy" width="150"></a>')
+        else:
+            shot = "N/A"
+        css = ' class="has_error"' if self.is_error(row) else ""
+        return (f'<tr{css}><td><a href="{html.escape(str(row[4]))}" target="_blank">{html.escape(str(row[5]))}</a></td>'
+                f'<td>{html.escape(str(row[6]))}</td><td>{html.escape(str(row[8]))}</td><td>{shot}</td></tr>\n')
+
+class ScreenshotStore:
+    """Screenshot writer that keeps image work off the probing threads.
+
+    ``capture`` grabs the PNG bytes from the driver and returns the final path at
+    once; a small background pool downscales and optimises the full image and
+    writes a JPEG thumbnail next to it under ``thumbs/``. Screenshots with the
+    same content hash share a single file.
+    """
+
+    def __init__(self, directory="Default", max_width=1600, thumbnail_width=300, workers=2):
+        self.directory = directory
+        self.max_width = max_width
+        self.thumbnail_width = thumbnail_width
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="screenshot")
+        self.lock = threading.Lock()
+        self.paths_by_hash = {}
+        self.used_paths = set()
+        self.pending = []
+        os.makedirs(os.path.join(directory, "thumbs"), exist_ok=True)
+
+    def capture(self, driver, name):
+        return self.save(driver.get_screenshot_as_png(), name)
+
+    def save(self, png_bytes, name):
+        digest = hashlib.sha256(png_bytes).hexdigest()
+        with self.lock:
+            path = self.paths_by_hash.get(digest)
+            if path:
+                return path
+            stem, ext = os.path.splitext(name)
+            path = os.path.join(self.directory, name)
+            suffix = 1
+            while path in self.used_paths:
+                path = os.path.join(self.directory, f"{stem}_{suffix}{ext}")
+                suffix += 1
+            self.paths_by_hash[digest] = path
+            self.used_paths.add(path)
+            self.pending.append(self.executor.submit(self._encode, png_bytes, path))
+        return path
+
+    def _encode(self, png_bytes, path):
+        with TRACER.span("screenshot_encode"):
+            self._write_images(png_bytes, path)
+
+    def _write_images(self, png_bytes, path):
+        try:
+            image = Image.open(BytesIO(png_bytes))
+            if image.width > self.max_width:
+                image = image.resize((self.max_width, round(image.height * self.max_width / image.width)))
+            image.save(path, "PNG", optimize=True)
+            thumbnail = image.convert("RGB")
+            thumbnail.thumbnail((self.thumbnail_width, self.thumbnail_width * 4))
+            thumbnail.save(os.path.join(self.directory, "thumbs", os.path.splitext(os.path.basename(path))[0] + ".jpg"),
+                           "JPEG", quality=70)
+        except Exception as e:
+            print(f"Failed to encode screenshot {path}, writing it as captured: {e}")
+            with open(path, "wb") as f:
+                f.write(png_bytes)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()
+
+def run_reports_in_parallel(excel_files, readiness=None, max_workers=None, max_tabs=1,
+                            rest_client=None, max_refresh_age_hours=None, state_store=None, incremental=False,
+                            recycle_pages=50, recycle_rss_mb=None, journal=None, screenshots=None,
+                            breaker=None, timeouts=None, driver_factory=None, browser=None, session=None,
+                            work_queue=None, scheduler=None, resume_queue=False, visual_baselines=None,
+                            update_baselines=False):
+    """Check every report of the workbooks and return ``(ResultSet, any_errors)``.
+
+    With ``work_queue`` this host is the coordinator: the planned report tasks
+    are put on the queue and the rows are gathered from the worker hosts. With
+    ``scheduler`` (a QueueScheduler) it is a worker that leases its tasks
+    instead of reading workbooks. A coordinator refuses a queue that still
+    holds reports of an earlier run unless ``resume_queue`` is set, in which
+    case it collects those instead of queueing the workbooks again. With
+    ``visual_baselines`` the rendered pages are checked for visual drift
+    before any row is persisted.
+    """
+    is_worker = scheduler is not None
     any_errors = "no error" 
     all_rows = []
-    probes = []
     probe = PowerBIReportProbe("auth")
     # probe._authenticate()
     # probe.quit_driver()
-    def wrapped_process_reports(excel_file, profile_suffix):
-        probe = PowerBIReportProbe(profile_suffix)
-        probe.init_selenium_driver_edge()
-        probes.append(probe)
-        df = pd.read_excel(excel_file)
-        for index, report in df.iterrows():
-            area = os.path.splitext(excel_file)[0].lower()
-            probe.get_report_all_pages(area, report["PBI Report Name"], report["PBI Link"], report["PBI Dataset Name"])
-            probe.close_open_reports()
+    tasks = load_report_tasks(excel_files)
+    carried_rows = []
+    refreshed_at = {}
+    completed_pages = set()
+    if journal:
+        probe.journal = journal
+        _, done_reports = journal.read()
+        completed_pages = journal.completed_pages()
+        if done_reports:
+            tasks = [task for task in tasks if task["url_report"] not in done_reports]
+            print(f"Resuming: {len(done_reports)} reports already done, {len(tasks)} left")
+    if rest_client:
+        metadata = run_preflight(tasks, rest_client, max_refresh_age_hours)
+        browser_tasks = []
+        for task in tasks:
+            meta = metadata.get(task["url_report"], {})
+            if meta.get("error"):
+                print(f"Not rendering '{task['report_name']}': {meta['error']} ({meta['refresh_status']} at {meta['refreshed_at']})")
+                probe.log_results(task["area"], task["report_name"], task["dataset_name"], task["url_report"],
+                                  task["url_report"], meta["error"], "error")
+                if journal:
+                    journal.report_done(task["url_report"])
+                any_errors = "error"
+                continue
+            task["page_urls"] = meta.get("pages")
+            refreshed_at[task["url_report"]] = meta.get("refreshed_at")
+            if incremental and state_store:
+                carried = state_store.plan_incremental(task, meta.get("refreshed_at"))
+                carried_rows.extend(carried)
+                if journal:
+                    for row in carried:
+                        journal.record_row(row)
+                if carried and not task["page_urls"]:
+                    print(f"Carrying forward '{task['report_name']}', nothing changed since the last run")
+                    if journal:
+                        journal.report_done(task["url_report"])
+                    continue
+            browser_tasks.append(task)
+        tasks = browser_tasks
+        all_rows.extend(probe.results[1:])
+    durations = load_report_durations()
+    if work_queue:
+        # Longest reports first, as ReportScheduler would deal them to a single worker
+        left = work_queue.remaining()
+        if left and not resume_queue:
+            raise RuntimeError(f"Work queue still holds {left} reports of an earlier run; "
+                               f"pass --resume-queue to collect them or remove the queue to start over")
+        if left:
+            print(f"Resuming the work queue: collecting {left} reports of an earlier run")
+        else:
+            ordered = list(ReportScheduler(tasks, 1, durations).queues[0])
+            work_queue.put(ordered)
+            print(f"Queued {len(ordered)} reports for the worker hosts")
+        queue_rows = collect_queue_results(work_queue, journal)
+        all_rows.extend(queue_rows)
+        # Worker hosts keep no durations file; time each report from its page times here
+        report_seconds = defaultdict(float)
+        for row in queue_rows:
+            try:
+                report_seconds[row[3]] += float(row[8])
+            except (TypeError, ValueError):
+                continue
+        for url_report, seconds in report_seconds.items():
+            previous = durations.get(url_report)
+            durations[url_report] = seconds if previous is None else (previous + seconds) / 2
+        tasks = []
+    run_locally = bool(tasks) or scheduler is not None
+    if scheduler is None:
+        max_workers = max(1, min(max_workers or len(excel_files), len(tasks)))
+        scheduler = ReportScheduler(tasks, max_workers, durations)
+        print(f"Scheduling {len(tasks)} reports across {max_workers} workers")
+    else:
+        max_workers = max_workers or 1
+
+    def start_driver(slot):
+        if driver_factory:
+            return driver_factory(slot)
+        driver_probe = PowerBIReportProbe(slot, max_tabs=max_tabs, browser=browser)
+        driver_probe.session = session
+        return driver_probe.init_selenium_driver_edge()
+
+    def wrapped_process_reports(worker_id):
+        probe = PowerBIReportProbe(worker_id, readiness=readiness, max_tabs=max_tabs, browser=browser)
+        probe.journal = journal
+        probe.screenshots = screenshots
+        probe.breaker = breaker
+        probe.timeouts = timeouts
+        probe.completed_pages = completed_pages
+        while True:
+            task = scheduler.next_task(worker_id)
+            if task is None:
+                break
+            start_time = time.time()
+            report_start = len(probe.results)
+            try:
+                lease = pool.acquire()
+            except Exception as e:
+                # Leave this worker's remaining tasks for the others to steal
+                print(f"Worker {worker_id} could not get a browser session, stopping: {e}")
+                scheduler.requeue(worker_id, task)
+                break
+            try:
+                for attempt in range(2):
+                    probe.driver = lease.driver
+                    probe.journal_attempt = uuid.uuid4().hex
+                    rows_before = len(probe.results)
+                    probe.get_report_all_pages(task["area"], task["report_name"], task["url_report"], task["dataset_name"],
+                                               page_urls=task.get("page_urls"), page_numbers=task.get("page_numbers"),
+                                               report_pages_count=task.get("report_pages_count"))
+                    lease.pages += len(probe.results) - rows_before
+                    if attempt or pool.is_healthy(lease.driver):
+                        break
+                    # The browser died under us: drop this report's partial rows and run it again
+                    print(f"Browser session in slot {lease.slot} crashed during '{task['report_name']}', retrying")
+                    del probe.results[rows_before:]
+                    if journal:
+                        journal.discard_attempt(probe.journal_attempt)
+                    try:
+                        pool.restart(lease)
+                    except Exception as e:
+                        print(f"Failed to restart browser for slot {lease.slot}: {e}")
+                        lease.healthy = False
+                        probe.journal_attempt = uuid.uuid4().hex
+                        probe.log_results(task["area"], task["report_name"], task["dataset_name"], task["url_report"],
+                                          task["url_report"], "error", "fatal_error")
+                        probe.has_found_any_errors = "error"
+                        break
+            finally:
+                probe.driver = None
+                pool.release(lease)
+            if journal:
+                journal.report_done(task["url_report"])
+            scheduler.record_duration(task, time.time() - start_time)
+            scheduler.report_done(worker_id, task, probe.results[report_start:])
         results_with_instance = []
         for row in probe.results[1:]:  # Skip header row
             results_with_instance.append(row)
         return results_with_instance, probe.has_found_any_errors
 
-    with ThreadPoolExecutor(max_workers=MAX_INSTANCES) as executor:
-        futures = [executor.submit(wrapped_process_reports, excel_file, i)
-                   for i, excel_file in enumerate(excel_files)]
+    pool = DriverPool(max_workers, start_driver, recycle_pages, recycle_rss_mb)
+    if run_locally:
+        pool.start()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker") as executor:
+        futures = [executor.submit(wrapped_process_reports, i) for i in range(max_workers if run_locally else 0)]
         for future in futures:
             results, has_error = future.result()
             all_rows.extend(results)
-            if has_error:
+            if has_error == "error":
                 any_errors = "error"  
-            for row in results:
-                key = (row[2], row[3], row[4])  # (url_report, url_page, page_nr)
-                instance = row[6]
-                merged_results[key][instance] = row[5]
-                all_keys.add(key)
+    # Every worker gave up on its browser; whatever is still queued was never checked
+    unchecked = scheduler.unassigned()
+    if unchecked:
+        print(f"No browser session left for {len(unchecked)} reports, logging them as errors")
+        rows_before = len(probe.results)
+        for task in unchecked:
+            probe.log_results(task["area"], task["report_name"], task["dataset_name"], task["url_report"],
+                              task["url_report"], "error", "fatal_error")
+            if journal:
+                journal.report_done(task["url_report"])
+        all_rows.extend(probe.results[rows_before:])
+        any_errors = "error"
+
+    if screenshots:
+        screenshots.flush()
+    if timeouts:
+        timeouts.history.flush()
+    if visual_baselines:
+        # Before the state store and the journal's final read, so incremental and resumed runs see the drift
+        drifted = visual_baselines.check(all_rows, update=update_baselines)
+        if journal:
+            for row in drifted:
+                journal.record_row(row)
+        if drifted:
+            any_errors = "error"
+    if state_store:
+        state_store.record_rows(all_rows, refreshed_at)
+    all_rows.extend(carried_rows)
+    if journal:
+        # The journal also holds pages finished by an interrupted run we resumed
+        all_rows, _ = journal.read()
+    results = ResultSet(all_rows).sorted()
+    if results.has_errors():
+        any_errors = "error"
 
-    for probe in probes:
+    pool.close()
+    if not is_worker:
+        # Only the coordinator (or a single host) owns report_durations.json
         try:
-            probe.quit_driver()
+            save_report_durations(scheduler.durations)
         except Exception as e:
-            print(f"Failed to quit driver: {e}")
-    headers = ["area", "report_name", "dataset_name", "url_report", "url_page", "page_num", "has_report_page_errors", "screenshot_path"]
-    results_all = [headers]
-    for key in sorted(all_keys, key=lambda x:str(x)):
-        base_row = next(r for r in all_rows if (r[2], r[3], r[4]) == key)
-        row = base_row[:-1]
-        results_all.append(row)
-    return results_all, any_errors
+            print(f"Failed to save report durations: {e}")
+    return results, any_errors
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config', default='tenants.yaml')
     parser.add_argument('-t', '--tenant', default='DEFAULT')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of Edge workers (defaults to one per workbook)')
+    parser.add_argument('--max-tabs', type=int, default=1,
+                        help='check up to this many pages of a report at once in separate tabs')
+    parser.add_argument('--preflight', action='store_true',
+                        help='read pages and dataset refresh state from the REST API before rendering')
+    parser.add_argument('--max-refresh-age', type=float, default=None,
+                        help='with --preflight, treat datasets not refreshed within this many hours as errors')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only re-check pages whose dataset refreshed or that failed last time (implies --preflight)')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted run from probe_journal.jsonl, skipping finished pages')
+    parser.add_argument('--screenshot-width', type=int, default=1600,
+                        help='downscale screenshots wider than this many pixels')
+    parser.add_argument('--attachment-mb', type=float, default=15,
+                        help='size budget for the screenshots attached to each email')
+    parser.add_argument('--breaker-threshold', type=int, default=3,
+                        help='consecutive failed pages after which a dataset is short-circuited (0 disables)')
+    parser.add_argument('--breaker-cooldown', type=float, default=300,
+                        help='seconds before a short-circuited dataset gets one page checked again')
+    parser.add_argument('--breaker-by-workspace', action='store_true',
+                        help='track datasets separately per workspace')
+    parser.add_argument('--timeout-factor', type=float, default=2.0,
+                        help='multiply the p95 of past wait times by this to get each timeout')
+    parser.add_argument('--timeout-floor', type=float, default=1,
+                        help='shortest adaptive timeout in seconds')
+    parser.add_argument('--timeout-ceiling', type=float, default=300,
+                        help='longest adaptive timeout in seconds')
+    parser.add_argument('--timing-report', action='store_true',
+                        help='list pages whose load time is regressing and exit')
+    parser.add_argument('--recycle-pages', type=int, default=50,
+                        help='restart a browser session after it has rendered this many pages')
+    parser.add_argument('--recycle-rss-mb', type=float, default=None,
+                        help='restart a browser session once its processes use more than this much memory')
+    parser.add_argument('--fixed-wait', type=float, default=None,
+                        help='sleep this many seconds per page instead of waiting for it to settle (to compare against readiness)')
+    parser.add_argument('--headless', action='store_true',
+                        help='run Edge headless even if the tenant browser profile does not ask for it')
+    parser.add_argument('--shared-session', action='store_true',
+                        help='sign in once and copy the cached session into every browser instead of using one Edge profile per worker')
+    parser.add_argument('--queue', default=None,
+                        help='distribute reports through this work queue (a .db file or a directory on a shared drive)')
+    parser.add_argument('--resume-queue', action='store_true',
+                        help='with --queue, collect the reports an earlier coordinator left on the queue instead of failing')
+    parser.add_argument('--worker', action='store_true',
+                        help='with --queue, run as a worker host that leases reports instead of the coordinator')
+    parser.add_argument('--worker-name', default=f"{socket.gethostname()}-{os.getpid()}",
+                        help='name this worker host uses for its leases')
+    parser.add_argument('--lease-seconds', type=float, default=900,
+                        help='seconds a leased report stays reserved without a heartbeat before it is requeued')
+    parser.add_argument('--drift-threshold', type=int, default=10,
+                        help='flag pages whose screenshot hash differs from its baseline in more than this many of 64 bits (0 disables)')
+    parser.add_argument('--update-baselines', action='store_true',
+                        help='accept the screenshots of this run as the new visual baselines')
     args = parser.parse_args()
 
     config = load_config(args.config)
-    profile_name = config.get(args.tenant)
+    tenant_settings = get_tenant_settings(config, args.tenant)
+    profile_name = tenant_settings.get("profile")
+    readiness = PageReadiness.from_config(tenant_settings)
+    if args.fixed_wait:
+        readiness = PageReadiness(reports=readiness.reports, **{**readiness.settings, "fixed_wait": args.fixed_wait})
+    browser = BrowserProfile.from_config(tenant_settings)
+    if args.headless:
+        browser.headless = True
 
     EXCEL_TO_EMAIL_MAP = {
         "finance": "tushar.kumarchopra@zebra.com",
@@ -418,85 +3058,77 @@ if __name__ == "__main__":
         "services": "tushar.kumarchopra@zebra.com"
     }
 
+    timing_history = TimingHistory()
+    if args.timing_report:
+        print_timing_regressions(timing_history)
+        raise SystemExit(0)
+    timeouts = AdaptiveTimeouts(timing_history, args.timeout_factor, args.timeout_floor, args.timeout_ceiling)
+
     excel_files = [f for f in os.listdir() if f.endswith(".xlsx") and not f.startswith("~$")]
-    MAX_INSTANCES = len(excel_files)
 
-    all_results, has_errors = run_reports_in_parallel(excel_files)
+    # Token and sign-in cookies are fetched on first use and cached in token_cache.json
+    auth_settings = tenant_settings.get("auth") or {}
+    scope = auth_settings.get("scope", POWERBI_SCOPE)
+    if auth_settings.get("token_endpoint"):
+        fetch_token = endpoint_token_fetcher(auth_settings["token_endpoint"], auth_settings["client_id"],
+                                             os.getenv(auth_settings.get("client_secret_env", "PBI_CLIENT_SECRET")), scope)
+    else:
+        fetch_token = interactive_token_fetcher(scope, auth_settings.get("authority"))
+    session_cache = SessionCache(fetch_token,
+                                 sign_in_driver=lambda: PowerBIReportProbe("auth").init_selenium_driver_edge(),
+                                 path=auth_settings.get("cache_file", TOKEN_CACHE_FILE),
+                                 sign_in_url=auth_settings.get("sign_in_url", POWERBI_HOME_URL))
+
+    rest_client = None
+    if args.preflight or args.incremental:
+        rest_client = PowerBIRestClient(session_cache.token, tenant_settings.get("api_base_url", "https://api.powerbi.com/v1.0/myorg"))
+
+    screenshots = ScreenshotStore(max_width=args.screenshot_width)
+    breaker = None
+    if args.breaker_threshold > 0:
+        breaker = DatasetCircuitBreaker(args.breaker_threshold, args.breaker_cooldown, args.breaker_by_workspace)
+    work_queue = open_work_queue(args.queue) if args.queue else None
+    visual_baselines = None
+    if args.drift_threshold > 0:
+        visual_baselines = VisualBaselineStore(threshold=args.drift_threshold)
+    if work_queue and args.worker:
+        # Worker host: lease reports until the queue is drained, results go back through the queue
+        scheduler = QueueScheduler(work_queue, args.worker_name, screenshots, args.lease_seconds)
+        run_reports_in_parallel([], readiness=readiness, max_workers=args.workers, max_tabs=args.max_tabs,
+                                recycle_pages=args.recycle_pages, recycle_rss_mb=args.recycle_rss_mb,
+                                screenshots=screenshots, breaker=breaker, timeouts=timeouts, browser=browser,
+                                session=session_cache if args.shared_session else None, scheduler=scheduler)
+        scheduler.close()
+        screenshots.close()
+        TRACER.print_summary()
+        TRACER.write()
+        raise SystemExit(0)
+    all_results, has_errors = run_reports_in_parallel(excel_files, readiness=readiness, max_workers=args.workers,
+                                                       max_tabs=args.max_tabs, rest_client=rest_client,
+                                                       max_refresh_age_hours=args.max_refresh_age,
+                                                       state_store=ProbeStateStore(), incremental=args.incremental,
+                                                       recycle_pages=args.recycle_pages, recycle_rss_mb=args.recycle_rss_mb,
+                                                       journal=ResultJournal(resume=args.resume),
+                                                       screenshots=screenshots, breaker=breaker,
+                                                       timeouts=timeouts, browser=browser,
+                                                       session=session_cache if args.shared_session else None,
+                                                       work_queue=work_queue, resume_queue=args.resume_queue,
+                                                       visual_baselines=visual_baselines,
+                                                       update_baselines=args.update_baselines)
+    screenshots.close()
 
     temp_probe = PowerBIReportProbe(profile_suffix="merged")
-    temp_probe.results = all_results
+    temp_probe.results = all_results.to_records()
     temp_probe.show_results()
 
-    for file in excel_files:
-        area_base = os.path.splitext(file)[0]
-        area = area_base.split()[0].lower()
-        print(f"Area:{area}")
-        email_recipient = EXCEL_TO_EMAIL_MAP.get(area)
-        if isinstance(email_recipient, list):
-            email_recipient=",".join(email_recipient)
-        file_errors = [
-            row for row in all_results[1:]
-            if (os.path.splitext(row[0])[0].split()[0].lower()) == area and str(row[6]).strip() == "error"
-        ]
-        print(file_errors)
-
-        # Build summary stats
-        summary_stats = defaultdict(lambda: {"total": 0, "errors": 0})
-        for row in all_results[1:]:
-            file_base = os.path.splitext(row[0])[0]
-            filename = file_base.split()[0].lower()
-            print(f"file:{filename}")
-            if filename != area:
-                continue
-            dataset = row[2]
-            status = str(row[6]).strip().lower()
-            summary_stats[dataset]["total"] += 1
-            if status == "error":
-                summary_stats[dataset]["errors"] += 1
-        
-        print(summary_stats)
-
-        # Start email content with summary table
-        email_content = f"""
-        <h2>Summary of report check results for area: {area.upper()}</h2>
-        <table border='1' style='border-collapse: collapse;'>
-            <tr>
-                <th style='padding: 8px;'>Semantic Model</th>
-                <th style='padding: 8px;'>Total Reports</th>
-                <th style='padding: 8px;'>Errors</th>
-                <th style='padding: 8px;'>Successful</th>
-            </tr>
-        """
-
-        for dataset, stats in summary_stats.items():
-            successful = stats["total"] - stats["errors"]
-            email_content += f"""
-            <tr>
-                <td style='padding: 8px;'>{dataset}</td>
-                <td style='padding: 8px;'>{stats['total']}</td>
-                <td style='padding: 8px;'>{stats['errors']}</td>
-                <td style='padding: 8px;'>{successful}</td>
-            </tr>
-            """
-
-        email_content += "</table>"
-
-        if file_errors:
-            email_content += "<h3>Errored Reports below:</h3>"
-            attachment_paths = []
-            for row in file_errors:
-                report_name = row[1]
-                dataset = row[2]
-                screenshot_path = row[7]
-                email_content += f"<p>Report: {report_name} <br>Dataset: {dataset}</p>"
-                if screenshot_path != "N/A" and os.path.exists(screenshot_path):
-                    attachment_paths.append(screenshot_path)
-                else:
-                    print("No screenshot for:", report_name)
+    # Render every area's email first, then send them all at once
+    summary = all_results.summarize()
+    notifications = [
+        render_area_email(area_key(file), summary.get(area_key(file), {"datasets": {}, "errors": []}),
+                          EXCEL_TO_EMAIL_MAP.get(area_key(file)), int(args.attachment_mb * 1024 * 1024))
+        for file in excel_files
+    ]
+    NotificationDispatcher(host=tenant_settings.get("sendgrid_host")).dispatch(notifications)
 
-        send_email(
-            to_email=email_recipient,
-            subject=f"Power BI Errors Detected - {area.capitalize()}",
-            content=email_content,
-            attachment_paths=attachment_paths
-        )
+    TRACER.print_summary()
+    TRACER.write()